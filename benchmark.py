@@ -0,0 +1,432 @@
+#! /usr/bin/env python
+
+from __future__ import print_function, division
+import sys, os
+import hashlib, json, shutil, tempfile, time
+from argparse import ArgumentParser, Namespace, RawDescriptionHelpFormatter
+from numpy import arange, exp, sqrt, concatenate, nextafter, inf, nan
+from numpy.random import RandomState
+from chemviz.unitsphere import sphere_fields
+from chemviz.sphereexport import export_field
+from chemviz.cubefile import CubeHeader, format_slab, stream_combine
+from chemviz.cubeexpr import mo_expression
+from chemviz.normalmodes import select_modes, scale_modes, write_mode_script
+from chemviz.commands.cube import main as cube_command
+from chemviz.commands.modes import ModeChunk, write_modes
+from chemviz.profiling import Profile, recording, phase
+
+# Baselines stored with the code, for the default sizes.
+DEFAULT_BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'benchmark_baselines.json')
+
+def main():
+    """\
+    This program benchmarks the unit sphere contractions, the cube
+    arithmetic and the normal mode writers on synthetic inputs: random
+    (hyper)polarizability tensors, smooth cubes of N**3 points and
+    random normal modes.  For each benchmark it reports the throughput,
+    the time of each phase and the peak traced memory, and compares the
+    results against stored baselines.  Throughputs are compared as
+    multiples of a reference workload timed in the same run, so the
+    baselines hold on other machines.  It exits with an error if an
+    output changed, if a benchmark got slower or needs more memory than
+    its baseline allows.  Before the benchmarks, the fast formatting of
+    cube data is checked against the % formatting it replaces.
+    """
+
+    from textwrap import dedent
+    parser = ArgumentParser(description=dedent(main.__doc__),
+                            formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument('--version', action='version', version='%(prog)s 1.0')
+    parser.add_argument('--only', help='Comma separated kinds of benchmarks '
+                        'to run.', default='unitsphere,cube,modes')
+    parser.add_argument('--points', help='Number of points of the Fibonacci '
+                        'sphere grid.', default=5000, type=int)
+    parser.add_argument('--frequencies', help='Number of frequencies of the '
+                        'hyperpolarizability tensor.', default=8, type=int)
+    parser.add_argument('--cube-sizes', help='Comma separated numbers of '
+                        'points N along each axis of the N**3 cubes, from '
+                        '50 to 400.', default='50')
+    parser.add_argument('--atoms', help='Number of atoms of the normal '
+                        'modes.', default=100, type=int)
+    parser.add_argument('--modes', help='Number of normal modes (default '
+                        '3*atoms-6).', type=int, required=False)
+    parser.add_argument('-n', '--repeat', help='Number of timed runs; the '
+                        'fastest is reported.', default=5, type=int)
+    parser.add_argument('--seed', help='Seed of the synthetic inputs.',
+                        default=0, type=int)
+    parser.add_argument('--baselines', help='JSON file of baselines.',
+                        default=DEFAULT_BASELINES)
+    parser.add_argument('--update', help='Store the results as the new '
+                        'baselines instead of comparing against them.',
+                        action='store_true', default=False)
+    parser.add_argument('--tolerance', help='Allowed relative loss of '
+                        'throughput, or growth of memory, before a benchmark '
+                        'counts as a regression.', default=0.25, type=float)
+    parser.add_argument('--json', help='Also write the results to this JSON '
+                        'file.', required=False)
+    parser.add_argument('--workdir', help='Directory for the synthetic '
+                        'inputs and the outputs (default a temporary '
+                        'directory, removed at the end).', required=False)
+    args = parser.parse_args()
+
+    kinds = [k.strip() for k in args.only.split(',') if k.strip()]
+    for kind in kinds:
+        if kind not in BENCHMARKS:
+            parser.error('Unknown benchmark ' + kind + ' (choose from ' +
+                         ', '.join(sorted(BENCHMARKS)) + ')')
+    sizes = [int(n) for n in args.cube_sizes.split(',') if n.strip()]
+    if args.modes is None:
+        args.modes = 3 * args.atoms - 6
+    if args.repeat < 1:
+        parser.error('--repeat must be positive')
+
+    mismatches = check_format_slab(RandomState(args.seed))
+    if mismatches:
+        sys.exit('format_slab differs from % formatting for {0} '
+                 'value(s)'.format(mismatches))
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='chemviz-bench-')
+    results = {}
+    try:
+        for kind in kinds:
+            for name, params, bench in BENCHMARKS[kind](workdir, args, sizes):
+                print('Running ' + name + ' ...', file=sys.stderr)
+                results[name] = measure(bench, args.repeat)
+                results[name]['params'] = params
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as fl:
+            baselines = json.load(fl)
+    failures = report(results, baselines, args.tolerance, args.update)
+
+    if args.json:
+        with open(args.json, 'w') as fl:
+            json.dump(results, fl, indent=2, sort_keys=True)
+            fl.write('\n')
+    if args.update:
+        baselines.update(results)
+        with open(args.baselines, 'w') as fl:
+            json.dump(baselines, fl, indent=2, sort_keys=True)
+            fl.write('\n')
+        print('Stored the baselines in ' + args.baselines)
+    elif failures:
+        sys.exit('{0} regression(s) against the baselines'.format(failures))
+
+def measure(bench, repeat):
+    """\
+    Time `repeat` runs of a benchmark, keeping the phases of the fastest,
+    then run it once more under tracemalloc for its peak memory.  A
+    benchmark returns the amount of work done and the files it wrote,
+    whose contents are checksummed.  Each run follows a run of the
+    reference workload, and the throughput is also given relative to
+    the fastest of those.
+    """
+    import tracemalloc
+    best = None
+    reference = None
+    for i in range(repeat):
+        wall = reference_workload()
+        reference = wall if reference is None else min(reference, wall)
+        profile = Profile('benchmark')
+        start = time.time()
+        with recording(profile):
+            work, files = bench()
+        wall = time.time() - start
+        if best is None or wall < best[0]:
+            best = (wall, profile, files)
+    wall, profile, files = best
+
+    digest = hashlib.sha1()
+    for name in sorted(files):
+        with open(name, 'rb') as fl:
+            digest.update(fl.read())
+
+    tracemalloc.start()
+    try:
+        bench()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return { 'wall' : wall, 'work' : work, 'throughput' : work / wall,
+             'reference' : reference, 'relative' : work / wall * reference,
+             'phases' : dict((name, profile.phases[name]['wall'])
+                             for name in profile.order),
+             'bytes_written' : sum(os.path.getsize(f) for f in files),
+             'peak_traced' : peak, 'checksum' : digest.hexdigest() }
+
+def reference_workload():
+    """\
+    Run a fixed mix of NumPy arithmetic and % formatting, the two kinds
+    of work the benchmarks are made of, and return its time.  The work
+    of a benchmark done in the time of the reference depends much less
+    on the machine than its throughput.
+    """
+    values = RandomState(0).normal(size=1000000)
+    start = time.time()
+    sqrt(exp(-values**2) + values**2).sum()
+    ''.join(' %12.5E' % v for v in values[:50000].tolist())
+    return time.time() - start
+
+def check_format_slab(rng, size=100000):
+    """\
+    Compare format_slab with ' %12.5E' % formatting, value by value, on
+    random values of every magnitude and on the values where rounding
+    is hardest: mantissas halfway between two roundings, powers of ten
+    and their neighbours, signed zeros, three-digit exponents and
+    values that are not finite.  Prints the first mismatches and returns
+    how many there were.
+    """
+    powers = 10.0**arange(-120, 121)
+    halfway = (arange(100000, 1000000, 7) + 0.5) / 100000
+    samples = [
+        rng.normal(size=size) * 10.0**rng.uniform(-110, 110, size),
+        concatenate([powers, nextafter(powers, 0), nextafter(powers, inf),
+                     -powers]),
+        concatenate([halfway * 10.0**e for e in (-99, -7, -1, 0, 1, 5, 98)]),
+        concatenate([[0.0, -0.0, 9.999995, 9.9999949999, 0.999995e-99]]),
+        # Not finite; the whole slab takes the % formatting.
+        concatenate([[nan, inf, -inf, 1.5]]),
+    ]
+    mismatches = 0
+    for values in samples:
+        lines = format_slab(values.reshape(-1, 1)).decode('ascii')
+        for value, line in zip(values, lines.splitlines()):
+            expected = ' %12.5E' % value
+            if line != expected:
+                if mismatches < 10:
+                    print('format_slab({0!r}) gave {1!r} instead of '
+                          '{2!r}'.format(float(value), line, expected),
+                          file=sys.stderr)
+                mismatches += 1
+    return mismatches
+
+def report(results, baselines, tolerance, update=False):
+    """\
+    Print a line per benchmark and compare it against its baseline.
+    Returns the number of regressions.
+    """
+    failures = 0
+    fmt = '{0:<22s} {1:>20s} {2:>10s} {3:>10s}  {4}'
+    print(fmt.format('benchmark', 'throughput', 'time (s)', 'memory',
+                     'status'))
+    for name in sorted(results):
+        result = results[name]
+        base = baselines.get(name)
+        problems = []
+        if update:
+            status = 'stored'
+        elif base is None:
+            status = 'no baseline'
+        else:
+            if result['checksum'] != base['checksum']:
+                problems.append('output changed')
+            change = result['relative'] / base['relative'] - 1
+            if change < -tolerance:
+                problems.append('{0:.0%} slower'.format(-change))
+            if result['peak_traced'] > (1 + tolerance) * base['peak_traced']:
+                growth = result['peak_traced'] / base['peak_traced'] - 1
+                problems.append('{0:.0%} more memory'.format(growth))
+            status = 'FAILED (' + ', '.join(problems) + ')' if problems \
+                     else 'ok ({0:+.0%})'.format(change)
+        failures += bool(problems)
+        rate = '{0:.4g} {1}/s'.format(result['throughput'],
+                                      result['params']['unit'])
+        print(fmt.format(name, rate,
+                         '{0:.4f}'.format(result['wall']),
+                         '{0:.1f} MB'.format(result['peak_traced'] / 1024**2),
+                         status))
+        print('    ' + ', '.join('{0} {1:.4f}'.format(p, t)
+                                 for p, t in result['phases'].items()))
+    return failures
+
+class Synthetic(object):
+    """\
+    Stand-in for a parsed output file, with the attributes used.
+    """
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+def unitsphere_benchmarks(workdir, options, sizes):
+    """\
+    Contract random hyperpolarizabilities, and random polarizabilities,
+    at several frequencies on a Fibonacci sphere and write a TCL script
+    per field.
+    """
+    rng = RandomState(options.seed)
+    nfreq, npoints = options.frequencies, options.points
+    molecules = [
+        ('unitsphere', Synthetic(calctype=set(['HYPERPOLARIZABILITY', 'SHG']),
+                                 hyperpolarizability={ 'SHG' : rng.normal(
+                                     size=(nfreq, 3, 3, 3)) })),
+        ('unitsphere-pol', Synthetic(calctype=set(['POLARIZABILITY']),
+                                     polarizability=rng.normal(
+                                         size=(nfreq, 3, 3)))),
+    ]
+    benches = []
+    for kind, data in molecules:
+        outdir = os.path.join(workdir, kind)
+        os.makedirs(outdir)
+
+        def bench(data=data, outdir=outdir):
+            with phase('compute'):
+                names, origins, fields, norms = sphere_fields(data,
+                                                              'fibonacci',
+                                                              npoints)
+            files = []
+            for i, (label, suffix) in enumerate(names):
+                files.append(os.path.join(outdir, (suffix or label) + '.tcl'))
+                export_field('tcl', files[-1], origins, fields[i], norms[i])
+            return len(names) * len(origins), files
+
+        params = { 'points' : npoints, 'frequencies' : nfreq,
+                   'unit' : 'vectors' }
+        benches.append(('{0}-{1}x{2}'.format(kind, nfreq, npoints), params,
+                        bench))
+    return benches
+
+def synthetic_cube(filename, n, rng, center):
+    """\
+    Write an MO-like cube of n**3 points, two lobes of opposite sign
+    around `center` plus a little noise, slab by slab.
+    """
+    step = 10.0 / n
+    lines = ['Synthetic cube\n', 'Benchmark of chemviz\n',
+             '{0:5d} {1:11.6f} {2:11.6f} {3:11.6f}\n'.format(1, -5, -5, -5)]
+    lines.extend('{0:5d} {1:11.6f} {2:11.6f} {3:11.6f}\n'.format(
+                 n, *(step if i == j else 0.0 for j in range(3)))
+                 for i in range(3))
+    lines.append('{0:5d} {1:11.6f} {2:11.6f} {3:11.6f} {4:11.6f}\n'.format(
+                 6, 6.0, 0.0, 0.0, 0.0))
+    header = CubeHeader(lines)
+    axis = -5 + step * (0.5 + arange(n))
+    y, z = axis[:,None], axis[None,:]
+    with open(filename, 'wb') as out:
+        out.write(header.text().encode('ascii'))
+        for start in range(0, n, 16):
+            x = axis[start:start+16,None,None]
+            r2 = (x - center[0])**2 + (y - center[1])**2 + (z - center[2])**2
+            slab = (x - center[0]) * exp(-r2)
+            slab = slab + 1e-4 * rng.normal(size=slab.shape)
+            out.write(format_slab(slab))
+
+def cube_benchmarks(workdir, options, sizes):
+    """\
+    Stream the difference of the absolute values of two cubes of N**3
+    points, parsing, computing, formatting and writing slab by slab.
+    Then run the cube command on the same cubes: an expression evaluated
+    on two workers, and LOD cubes with an isosurface mesh.
+    """
+    benches = []
+    for n in sizes:
+        rng = RandomState(options.seed)
+        cubes = [os.path.join(workdir, 'cube{0}{1}.cube'.format(n, c))
+                 for c in 'ab']
+        synthetic_cube(cubes[0], n, rng, (0.5, 0.0, 0.0))
+        synthetic_cube(cubes[1], n, rng, (-0.5, 0.3, 0.0))
+        output = os.path.join(workdir, 'diff{0}.cube'.format(n))
+        expression = mo_expression(2, difference=True)
+        params = { 'size' : n, 'unit' : 'voxels' }
+
+        def bench(cubes=cubes, output=output, n=n):
+            with open(output, 'wb') as out:
+                stream_combine(expression, cubes, out)
+            return n**3, [output]
+
+        benches.append(('cube-diff-{0}'.format(n), params, bench))
+
+        output = os.path.join(workdir, 'expr{0}.cube'.format(n))
+
+        def bench(cubes=cubes, output=output, n=n):
+            cube_command(cubes + ['-e', '0.5*abs(a)**2 - abs(b)**2', '-j', '2',
+                                  '-o', output])
+            return n**3, [output]
+
+        benches.append(('cube-expr-j2-{0}'.format(n), params, bench))
+
+        root = os.path.join(workdir, 'lod{0}'.format(n))
+
+        def bench(cubes=cubes, root=root, n=n):
+            cube_command(cubes + ['-d', '1', '--lod', '2,4', '--isosurface',
+                                  '0.05', '-o', root + '.cube'])
+            return n**3, [root + '_lod2.cube', root + '_lod4.cube',
+                          root + '.obj']
+
+        benches.append(('cube-lod-iso-{0}'.format(n), params, bench))
+    return benches
+
+def modes_benchmarks(workdir, options, sizes):
+    """\
+    Select every real mode of a random molecule and write a TCL script
+    per mode, then write the modes through the modes command as one TCL
+    bundle and as an XYZ trajectory per mode.
+    """
+    rng = RandomState(options.seed)
+    natoms, nmodes = options.atoms, options.modes
+    frequencies = rng.uniform(-200, 4000, nmodes)
+    # A few degenerate pairs.
+    frequencies[1::17] = frequencies[::17][:len(frequencies[1::17])]
+    coordinates = rng.uniform(-10, 10, (natoms, 3))
+    normal_modes = rng.normal(size=(nmodes, natoms, 3))
+    data = Synthetic(coordinates=coordinates, normal_modes=normal_modes,
+                     v_frequencies=frequencies, natoms=natoms, nmodes=nmodes)
+    outdir = os.path.join(workdir, 'modes')
+    os.makedirs(outdir)
+    params = { 'atoms' : natoms, 'modes' : nmodes, 'unit' : 'modes' }
+
+    def bench():
+        with phase('compute'):
+            selected, skipped, lookups = select_modes(frequencies, None, 0.0,
+                                                      float('inf'))
+            displacements = scale_modes(normal_modes, 2.0)
+        files = []
+        for i, name in selected:
+            files.append(os.path.join(outdir, name + '-vmd.tcl'))
+            write_mode_script(files[-1], coordinates, displacements[i], 2.0,
+                              'yellow')
+        return len(selected), files
+
+    benches = [('modes-{0}x{1}'.format(natoms, nmodes), params, bench)]
+
+    # The options of the modes command that write_modes reads.
+    writers = [
+        ('bundle', Namespace(scale=2.0, trajectory=None, format='tcl',
+                             output=None)),
+        ('xyz', Namespace(scale=2.0, trajectory='xyz', frames=10,
+                          amplitude=1.0)),
+    ]
+    for kind, command_options in writers:
+        freqfile = os.path.join(workdir, 'modes-' + kind + '.out')
+        chunk_dir = os.path.join(workdir, 'modes-' + kind)
+
+        def bench(command_options=command_options, freqfile=freqfile,
+                  chunk_dir=chunk_dir):
+            with phase('compute'):
+                selected = select_modes(frequencies, None, 0.0,
+                                        float('inf'))[0]
+            chunk = ModeChunk(freqfile, chunk_dir, selected, 'yellow')
+            return len(selected), write_modes(chunk, command_options, data)
+
+        benches.append(('modes-{0}-{1}x{2}'.format(kind, natoms, nmodes),
+                        params, bench))
+    return benches
+
+# The kinds of benchmarks, each making a list of (name, parameters,
+# benchmark) for the options.
+BENCHMARKS = {
+    'unitsphere' : unitsphere_benchmarks,
+    'cube' : cube_benchmarks,
+    'modes' : modes_benchmarks,
+}
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(1)
@@ -0,0 +1,54 @@
+"""\
+Visualization of chemistry calculations: unit sphere representations of
+(hyper)polarizabilities, operations on Gaussian cube files, and normal
+mode plots for VMD.
+
+The functions exported here take parsed output files (from chem.collect
+or a ParseCache) or arrays and return arrays, so steps can be chained in
+memory.  The generate_unitsphere.py, manipulate_MOs.py and
+mode_plotfiles.py scripts, and the chemviz driver (python -m chemviz),
+are thin command line wrappers around them.
+
+The exported names are imported from their modules on first use, so
+importing the package (as the driver does) does not load NumPy.
+"""
+
+from __future__ import print_function, division
+from importlib import import_module
+
+# Module defining each exported name.
+_EXPORTS = {
+    'contract' : 'tensors',
+    'magnitudes' : 'tensors',
+    'normalize' : 'tensors',
+    'build_grid' : 'spheregrid',
+    'response_tensors' : 'unitsphere',
+    'sphere_fields' : 'unitsphere',
+    'CubeHeader' : 'cubefile',
+    'read_cube' : 'cubefile',
+    'write_cube' : 'cubefile',
+    'combine_cubes' : 'cubefile',
+    'CubeExpression' : 'cubeexpr',
+    'mo_expression' : 'cubeexpr',
+    'block_average' : 'cubelod',
+    'FrequencyIndex' : 'normalmodes',
+    'select_modes' : 'normalmodes',
+    'scale_modes' : 'normalmodes',
+    'mode_frames' : 'normalmodes',
+    'ParseCache' : 'parsecache',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError('module {0!r} has no attribute '
+                             '{1!r}'.format(__name__, name))
+    value = getattr(import_module('.' + _EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,9 @@
+from __future__ import print_function, division
+import sys
+from .cli import main
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(1)
@@ -0,0 +1,141 @@
+"""\
+Helpers for running one of the scripts over many input files, optionally
+spread over a pool of worker processes.
+"""
+
+from __future__ import print_function, division
+from glob import glob
+from multiprocessing import Pool, cpu_count
+from contextlib import contextmanager
+from .profiling import phase
+import sys, os
+
+
+def expand_inputs(patterns, manifest=None):
+    """\
+    Expand the given file names and glob patterns (for shells that do
+    not), plus the entries of an optional manifest file with one path or
+    pattern per line (blank lines and lines starting with # are
+    ignored).  A directory stands for the files in it, not counting
+    hidden files.  The order is kept and duplicates are dropped.
+    """
+    patterns = list(patterns or [])
+    if manifest:
+        with open(manifest) as fl:
+            for line in fl:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    patterns.append(line)
+
+    files = []
+    seen = set()
+    for pattern in patterns:
+        for name in _expand_directories(sorted(glob(pattern)) or [pattern]):
+            if name not in seen:
+                seen.add(name)
+                files.append(name)
+    return files
+
+
+def _expand_directories(names):
+    """\
+    Replace each directory in a list of paths by its visible files.
+    """
+    for name in names:
+        if os.path.isdir(name):
+            for f in sorted(os.listdir(name)):
+                path = os.path.join(name, f)
+                if not f.startswith('.') and os.path.isfile(path):
+                    yield path
+        else:
+            yield name
+
+
+def worker_count(jobs):
+    """\
+    Number of worker processes to use; 0 or less means all cores.
+    """
+    jobs = int(jobs)
+    if jobs <= 0:
+        jobs = cpu_count()
+    return jobs
+
+
+@contextmanager
+def _nothing():
+    yield
+
+
+class _Task(object):
+    """\
+    Picklable wrapper that calls func(item) and captures any error, so
+    a bad input does not take down the rest of the batch.
+    """
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, item):
+        try:
+            return item, self.func(item), None
+        except Exception as e:
+            return item, None, '{0}: {1}'.format(type(e).__name__, e)
+
+
+def run_batch(func, items, jobs=1, progress=True, stream=None):
+    """\
+    Call func(item) for every item, on `jobs` worker processes.  Errors
+    are isolated per item.  If `progress` is set a line is printed to
+    `stream` (default stderr) as each item finishes.  Returns a list of
+    (item, result, error) tuples in the order the items finished, where
+    error is None on success.
+    """
+    items = list(items)
+    stream = stream or sys.stderr
+    task = _Task(func)
+    jobs = min(worker_count(jobs), max(len(items), 1))
+
+    if jobs == 1:
+        pool = None
+        results = (task(item) for item in items)
+    else:
+        pool = Pool(jobs)
+        chunksize = max(1, len(items) // (jobs * 8))
+        results = pool.imap_unordered(task, items, chunksize)
+
+    done = []
+    fmt = '[{0:>{w}}/{1}] {2}: {3}'
+    width = len(str(len(items)))
+    try:
+        # The phases of the items are only recorded when they run in this
+        # process; otherwise the whole pool is one phase.
+        with phase('workers') if pool is not None else _nothing():
+            for item, result, error in results:
+                done.append((item, result, error))
+                if progress:
+                    status = 'FAILED ({0})'.format(error) if error else 'ok'
+                    print(fmt.format(len(done), len(items), item, status,
+                                     w=width), file=stream)
+    except KeyboardInterrupt:
+        if pool is not None:
+            pool.terminate()
+        raise
+    if pool is not None:
+        pool.close()
+        pool.join()
+    return done
+
+
+def report_failures(done, stream=None, noun='files'):
+    """\
+    Print a summary of the failed items of a batch, called `noun`, and
+    return how many there were.
+    """
+    stream = stream or sys.stderr
+    failed = [(item, error) for item, result, error in done if error]
+    if failed:
+        print('{0} of {1} {2} failed:'.format(len(failed), len(done), noun),
+              file=stream)
+        for item, error in failed:
+            print('  {0}: {1}'.format(item, error), file=stream)
+    return len(failed)
@@ -0,0 +1,53 @@
+"""\
+The choices and defaults of the command line options: formats, grids,
+color maps and the functions of cube expressions.  They are kept here,
+without NumPy, so the commands can build their parsers (and answer
+--help and --version) without loading the modules that use them.
+"""
+
+# Kinds of grids of field directions on the unit sphere.
+GRID_NAMES = ('fibonacci', 'lattice')
+
+# Color maps as evenly spaced rgb anchors from the smallest to the
+# largest intensity.  Tables with any number of bins are interpolated
+# from these.
+COLORMAPS = {
+    'bwr' : ((0.0, 0.0, 1.0), (1.0, 1.0, 1.0), (1.0, 0.0, 0.0)),
+    'grayscale' : ((0.0, 0.0, 0.0), (1.0, 1.0, 1.0)),
+    'viridis' : ((0.267, 0.005, 0.329), (0.231, 0.322, 0.545),
+                 (0.129, 0.569, 0.549), (0.369, 0.788, 0.384),
+                 (0.993, 0.906, 0.144)),
+}
+
+# Largest number of bins of a color map: the colors of the VMD color
+# scale.
+MAX_BINS = 1024
+
+# File extension for each unit sphere export format.
+EXTENSIONS = { 'tcl' : '.tcl', 'npz' : '.npz', 'ply' : '.ply',
+               'hdf5' : '.h5' }
+
+# Formats that hold all fields of an output (every frequency and type)
+# in one file; the others are written as a file per field.
+STACKED_FORMATS = ('npz', 'hdf5')
+
+# Default number of planes along the first axis of a cube held in
+# memory at once.
+DEFAULT_PLANES = 16
+
+# Elementwise functions that may be used in a cube expression.
+FUNCTION_NAMES = ('abs', 'sqrt', 'exp', 'log', 'log10', 'sin', 'cos', 'tan',
+                  'tanh')
+
+# Formats of isosurface meshes.
+MESH_FORMATS = ('obj', 'ply')
+
+# Frequencies closer than this (in cm-1) are the same mode, unless the
+# user gives a tolerance.
+DEFAULT_TOLERANCE = 1.0e-3
+
+# File extension of each normal mode bundle format.
+BUNDLE_EXTENSIONS = { 'tcl' : '.tcl', 'npz' : '.npz', 'hdf5' : '.h5' }
+
+# File extension of each trajectory format.
+TRAJECTORY_EXTENSIONS = { 'xyz' : '.xyz', 'dcd' : '.dcd', 'npy' : '.npy' }
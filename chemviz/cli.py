@@ -0,0 +1,120 @@
+"""\
+The chemviz driver: one entry point (python -m chemviz) for the
+unitsphere, cube and modes commands.  Only the command that is run is
+imported, and a manifest of many command lines runs in one process,
+reusing the loaded modules and the files already parsed.
+"""
+
+from __future__ import print_function, division
+import sys
+from .commands import COMMANDS, load
+
+
+def run(command, argv):
+    """\
+    Run one command with its arguments in this process.  Returns its
+    exit status, and prints the message of a failing command to stderr,
+    instead of leaving the process.
+    """
+    try:
+        load(command).main(argv, 'chemviz ' + command)
+    except SystemExit as e:
+        if e.code is None or e.code == 0:
+            return 0
+        if not isinstance(e.code, int):
+            print(e.code, file=sys.stderr)
+            return 1
+        return e.code
+    return 0
+
+
+def read_manifest(filename):
+    """\
+    Read a manifest of command lines, one per line, such as
+    "modes freq.out -f npz".  Blank lines and comments starting with #
+    are ignored.  Returns a list of (line number, words).
+    """
+    from shlex import split
+    jobs = []
+    with open(filename) as fl:
+        for number, line in enumerate(fl, 1):
+            words = split(line, comments=True)
+            if words:
+                jobs.append((number, words))
+    return jobs
+
+
+def run_manifest(filename, stream=None):
+    """\
+    Run every command line of a manifest in this process, parsing each
+    input file once.  A failing line does not stop the others.  Returns
+    the number of lines that failed.
+    """
+    from .parsecache import keep_parsed
+    stream = stream or sys.stderr
+    jobs = read_manifest(filename)
+    keep_parsed()
+    failed = []
+    fmt = '[{0:>{w}}/{1}] {2}: {3}'
+    width = len(str(len(jobs)))
+    try:
+        for k, (number, words) in enumerate(jobs, 1):
+            line = ' '.join(words)
+            if words[0] not in COMMANDS:
+                status = 'unknown command ' + words[0]
+            else:
+                try:
+                    code = run(words[0], words[1:])
+                    status = 'exit status {0}'.format(code) if code else None
+                except Exception as e:
+                    status = '{0}: {1}'.format(type(e).__name__, e)
+            if status:
+                failed.append((number, line, status))
+            print(fmt.format(k, len(jobs), line,
+                             'FAILED ({0})'.format(status) if status else 'ok',
+                             w=width), file=stream)
+    finally:
+        keep_parsed(False)
+
+    if failed:
+        print('{0} of {1} lines failed:'.format(len(failed), len(jobs)),
+              file=stream)
+        for number, line, status in failed:
+            print('  line {0}: {1}: {2}'.format(number, line, status),
+                  file=stream)
+    return len(failed)
+
+
+def main(argv=None):
+    """\
+    This program visualizes chemistry calculations.  It runs one of the
+    commands below, each with its own options (see chemviz COMMAND -h),
+    or a manifest with one command line per line, all in one process.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
+    # A command is dispatched before anything else is imported.
+    if argv and argv[0] in COMMANDS:
+        status = run(argv[0], argv[1:])
+        if status:
+            sys.exit(status)
+        return
+
+    from argparse import ArgumentParser, RawDescriptionHelpFormatter
+    from textwrap import dedent
+    commands = '\n'.join('  {0:<12s}{1}'.format(name, COMMANDS[name][1])
+                         for name in sorted(COMMANDS))
+    parser = ArgumentParser(prog='chemviz', description=dedent(main.__doc__),
+                            epilog='commands:\n' + commands,
+                            formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument('--version', action='version', version='%(prog)s 1.0')
+    parser.add_argument('-m', '--manifest', help='File of command lines to '
+                        'run, such as "modes freq.out -f npz", one per line.',
+                        required=False)
+    args = parser.parse_args(argv)
+    if not args.manifest:
+        parser.error('Give a command ({0}) or a manifest.'.format(
+                     ', '.join(sorted(COMMANDS))))
+    if run_manifest(args.manifest):
+        sys.exit(1)
@@ -0,0 +1,23 @@
+"""\
+The commands of the chemviz driver, one module per command, each with a
+main(argv, prog) that parses its own options.  A command module (and
+the NumPy stack behind it) is only imported when the command is run.
+"""
+
+from __future__ import print_function, division
+from importlib import import_module
+
+# Module of each command, with the one-line help of the driver.
+COMMANDS = {
+    'unitsphere' : ('unitsphere', 'unit sphere fields of '
+                    '(hyper)polarizabilities'),
+    'cube' : ('cube', 'scale, subtract or combine Gaussian cube files'),
+    'modes' : ('modes', 'normal mode plots and trajectories for VMD'),
+}
+
+
+def load(command):
+    """\
+    Import the module of a command.
+    """
+    return import_module('.' + COMMANDS[command][0], __name__)
@@ -0,0 +1,179 @@
+"""\
+The cube command (manipulate_MOs.py): scaling, differences and
+expressions over Gaussian cube files.
+"""
+
+from __future__ import print_function, division
+import sys, os
+from ..choices import DEFAULT_PLANES, FUNCTION_NAMES, MESH_FORMATS
+from ..parsecache import add_cache_arguments, cache_from_options
+from ..profiling import add_profile_arguments, check_profile_arguments, \
+                         profiled, phase, count, count_bytes
+from ..incremental import add_incremental_arguments, \
+                          check_incremental_arguments, run_incremental, \
+                          parameters
+from ..batch import run_batch
+
+# Options that shape the outputs, recorded for incremental builds.
+PARAMETERS = ('scale', 'difference', 'expr', 'output', 'lod', 'isosurface',
+              'iso_lod', 'mesh_format')
+
+def factor_list(text):
+    """\
+    Parse a comma separated list of downsampling factors.
+    """
+    factors = sorted(set(int(f) for f in text.split(',') if f.strip()))
+    if not factors or min(factors) < 1:
+        raise ValueError('Factors must be positive integers')
+    return factors
+
+def factor(text):
+    """\
+    Parse a single downsampling factor.
+    """
+    value = int(text)
+    if value < 1:
+        raise ValueError('Factors must be positive integers')
+    return value
+
+def main(argv=None, prog=None):
+    """\
+    This program takes Gaussian cube files and either scales the 
+    MO density, calculates the difference in two cube files, or
+    evaluates an arithmetic expression over several cube files. 
+    """
+
+    from argparse import ArgumentParser, RawDescriptionHelpFormatter
+    from textwrap import dedent
+    parser = ArgumentParser(prog=prog,
+                            description=dedent(main.__doc__),
+                            formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument('--version', action='version', version='%(prog)s 1.0')
+    parser.add_argument('cubefiles', help='Cube files containing the MOs', 
+                        nargs='+')
+    parser.add_argument('-s', '--scale', help='Value to scale the values from '
+                        'a cube file or difference between cube files.', 
+                        required=False, default=1.0, type=float)
+    parser.add_argument('-d', '--difference', help='Argument for making '
+                        'the difference between two cube files.', required=False,
+                        default=False)
+    parser.add_argument('-e', '--expr', help='Expression to evaluate, with '
+                        'the cube files bound to a, b, c, ... in order, e.g. '
+                        '"0.5*abs(a)**2 - abs(b)**2 + c".  Allowed functions: '
+                        + ', '.join(sorted(FUNCTION_NAMES)) + '.', required=False)
+    parser.add_argument('-o', '--output', help='Name of the output file.',
+                        required=True)
+    parser.add_argument('--planes', help='Number of grid planes held in '
+                        'memory at once.', default=DEFAULT_PLANES, type=int)
+    parser.add_argument('-j', '--jobs', help='Number of workers the slabs '
+                        'are processed on (0 uses all cores).', default=1,
+                        type=int)
+    parser.add_argument('--threads', help='Use threads instead of processes '
+                        'for the workers.', action='store_true', default=False)
+    parser.add_argument('--lod', help='Comma separated factors, e.g. 2,4,8, '
+                        'by which to downsample the result by block averaging.'
+                        '  Each level is written to OUTPUT_lod<factor>.cube '
+                        'instead of the full-resolution cube.',
+                        type=factor_list, default=[])
+    parser.add_argument('--isosurface', help='Extract the isosurfaces of the '
+                        'result at plus and minus this value, e.g. 0.02, and '
+                        'write them as a mesh named after the output.',
+                        type=float, required=False)
+    parser.add_argument('--iso-lod', help='Downsampling factor of the grid '
+                        'the isosurfaces are extracted from.', default=1,
+                        type=factor)
+    parser.add_argument('--mesh-format', help='Format of the isosurface mesh.',
+                        choices=MESH_FORMATS, default='obj')
+    parser.add_argument('--cache-cubes', help='Keep the parsed cubes in the '
+                        'cache of parsed files, memory-mapped, for repeated '
+                        'runs over the same cubes.  By default, and for '
+                        'cubes larger than the cache, the text is streamed.',
+                        action='store_true', default=False)
+    add_cache_arguments(parser)
+    add_incremental_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    check_incremental_arguments(parser, args)
+    check_profile_arguments(parser, args)
+    with profiled(args, 'cube'):
+        run(args, parser)
+
+def run(args, parser):
+    """\
+    Run the command with the parsed options.
+    """
+    from ..cubeexpr import mo_expression
+    try:
+        # What happens is determined by the command line options: an
+        # expression, the difference between two cube files, or scaling
+        # a cube file.
+        expression = mo_expression(len(args.cubefiles), args.expr,
+                                   args.difference, args.scale)
+        cubefiles = [args.cubefiles[i] for i in expression.indices()]
+        if not args.incremental:
+            combine(expression, cubefiles, args)
+            return
+
+        # Only rebuild the output if the cubes or the options changed
+        # since the last run, or it is missing.
+        def inputs():
+            return [(args.output, cubefiles)]
+        def process(outputs):
+            return run_batch(lambda output: combine(expression, cubefiles,
+                                                    args), outputs)
+        # The order of the cubes binds them to a, b, c, ...
+        params = parameters(args, PARAMETERS)
+        params['cubefiles'] = [os.path.abspath(f) for f in args.cubefiles]
+        if run_incremental(args, 'cube', inputs, process, params):
+            sys.exit(1)
+    except ValueError as e:
+        sys.exit(str(e))
+
+def combine(expression, cubefiles, options):
+    """\
+    Evaluate the expression over the cube files and write the result, or
+    its LOD cubes and isosurface mesh.  Returns the files written.
+    """
+    from ..cubefile import stream_combine, combine_slabs
+    from ..cubelod import lod_planes, build_lod, lobes, write_mesh
+    # The cubes used by the expression are streamed slab by slab and the
+    # whole expression is evaluated on each slab at once, so memory use
+    # does not depend on the size of the grid.  With several jobs the
+    # slabs are spread over a pool of workers.  For the lighter LOD
+    # cubes and isosurface meshes the full-resolution cube is not
+    # written.
+    cache = cache_from_options(options) if options.cache_cubes else None
+    count('cubes', len(cubefiles))
+    if options.lod or options.isosurface:
+        root, ext = os.path.splitext(options.output)
+        outputs = dict((f, '{0}_lod{1}{2}'.format(root, f, ext))
+                       for f in options.lod)
+        volume_factor = options.iso_lod if options.isosurface else None
+        planes = lod_planes(options.planes, list(outputs) +
+                            [volume_factor or 1])
+        header, slabs = combine_slabs(expression, cubefiles, planes,
+                                      cache)
+        header, volume = build_lod(header, slabs, outputs, volume_factor)
+        written = list(outputs.values())
+        if options.isosurface:
+            with phase('isosurface'):
+                surfaces = lobes(volume, header, options.isosurface)
+            count('triangles', sum(len(faces) for name, verts, faces
+                                   in surfaces))
+            written.append(root + '.' + options.mesh_format)
+            with phase('write'):
+                write_mesh(written[-1], surfaces, options.mesh_format)
+    else:
+        written = [options.output]
+        # A failed run, say with cubes on different grids, leaves no
+        # empty or partial output behind.
+        try:
+            with open(options.output, 'wb') as out:
+                stream_combine(expression, cubefiles, out, options.planes,
+                               cache, options.jobs, options.threads)
+        except BaseException:
+            if os.path.exists(options.output):
+                os.remove(options.output)
+            raise
+    count_bytes(written)
+    return written
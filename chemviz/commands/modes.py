@@ -0,0 +1,372 @@
+"""\
+The modes command (mode_plotfiles.py): normal mode plots and
+trajectories for VMD.
+"""
+
+from __future__ import print_function, division
+import sys, os
+from functools import partial
+from ..batch import expand_inputs, run_batch, report_failures, worker_count
+from ..parsecache import add_cache_arguments, cache_from_options
+from ..profiling import add_profile_arguments, check_profile_arguments, \
+                         profiled, phase, count, count_bytes
+from ..choices import BUNDLE_EXTENSIONS, TRAJECTORY_EXTENSIONS, \
+                     DEFAULT_TOLERANCE
+from ..incremental import add_incremental_arguments, \
+                          check_incremental_arguments, run_incremental, \
+                          parameters
+
+# Options that shape the outputs, recorded for incremental builds.
+PARAMETERS = ('outdir', 'scale', 'vfreq', 'tol', 'low', 'high', 'format',
+              'output', 'trajectory', 'frames', 'amplitude')
+
+def frequency_request(text):
+    """\
+    Parse a requested frequency, or a range of frequencies low:high
+    returned as a (low, high) pair.
+    """
+    if text == 'all':
+        return text
+    if ':' in text:
+        low, high = (float(x) for x in text.split(':', 1))
+        if low > high:
+            raise ValueError('The range ' + text + ' is empty')
+        return low, high
+    return float(text)
+
+def main(argv=None, prog=None):
+    """\
+    This program takes the normal modes from a frequencies file and 
+    generates files for plotting the normal modes in VMD.  
+
+    """
+
+    from argparse import ArgumentParser, RawDescriptionHelpFormatter
+    from textwrap import dedent
+    parser = ArgumentParser(prog=prog,
+                            description=dedent(main.__doc__),
+                            formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument('--version', action='version', version='%(prog)s 1.0')
+    parser.add_argument('freqfile', help='File(s) containing the normal '
+                        'modes, or directories of them.  Glob patterns are '
+                        'expanded.', nargs='*')
+    parser.add_argument('--manifest', help='File listing further frequency '
+                        'files (or glob patterns), one per line.',
+                        required=False)
+    parser.add_argument('-j', '--jobs', help='Number of worker processes used '
+                        'for many files (0 uses all cores).', default=1,
+                        type=int)
+    parser.add_argument('-d', '--outdir', help='Directory in which each '
+                        'frequency file of a batch gets its own directory of '
+                        'outputs.  Defaults to the directory of the file.',
+                        required=False)
+    parser.add_argument('-s', '--scale', help='Scale factor for the normal '
+                        'mode vector', default=2.00, type=float)
+    parser.add_argument('-v', '--vfreq', help='Requested normal mode '
+                        'frequencies, or ranges of frequencies low:high, '
+                        'or all the modes between --low and --high.',
+                        nargs='+', type=frequency_request, default=['all'])
+    parser.add_argument('-t', '--tol', help='Frequencies closer than this '
+                        'are the same mode, for lookups and degeneracy.',
+                        default=DEFAULT_TOLERANCE, type=float)
+    parser.add_argument('--low', help='Lowest normal mode frequency used for'
+                        ' making TCL scripts', default=float(400), type=float)
+    parser.add_argument('--high', help='Highest normal mode frequency used'
+                        ' for making TCL scripts', default=float(1800), type=float)
+    parser.add_argument('-f', '--format', help='Write a TCL script per '
+                        'mode (files), or all modes to one bundle: a TCL '
+                        'file with a proc per mode and a byte-offset index, '
+                        'a NumPy archive, or an HDF5 group, indexed by '
+                        'frequency.', choices=['files'] +
+                        sorted(BUNDLE_EXTENSIONS), default='files')
+    parser.add_argument('-o', '--output', help='Name of the bundle file.  '
+                        'Defaults to the name of the frequency file with '
+                        'the extension of the format.', required=False)
+    parser.add_argument('--trajectory', help='Instead of the arrows, write '
+                        'an animation of each mode as a multi-frame XYZ, a '
+                        'DCD or a NumPy trajectory.',
+                        choices=sorted(TRAJECTORY_EXTENSIONS), required=False)
+    parser.add_argument('--frames', help='Number of frames in one period of '
+                        'a trajectory.', default=20, type=int)
+    parser.add_argument('--amplitude', help='Largest displacement of a '
+                        'trajectory, as a multiple of the normal mode '
+                        'vector.', default=0.5, type=float)
+    add_cache_arguments(parser)
+    add_incremental_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    check_incremental_arguments(parser, args)
+    check_profile_arguments(parser, args)
+    with profiled(args, 'modes'):
+        run(args, parser)
+
+def run(args, parser):
+    """\
+    Run the command with the parsed options.
+    """
+    # Expand the list of files to process.
+    freqfiles = expand_inputs(args.freqfile, args.manifest)
+    if not freqfiles:
+        parser.error('No frequency files were given.')
+    if args.trajectory and args.frames < 1:
+        parser.error('The number of frames must be positive.')
+    batch = (len(freqfiles) > 1 or args.outdir is not None or
+             any(os.path.isdir(name) for name in args.freqfile))
+    if batch and args.output:
+        parser.error('--output can only be used with a single file.')
+
+    # Only the files that changed since the last run, or whose outputs
+    # are missing, are processed, and possibly new files as they come.
+    if args.incremental:
+        process = partial(run_batch, partial(build_file, options=args,
+                                             outdir=None if batch else ''),
+                          jobs=args.jobs)
+        def inputs():
+            return [(name, [name]) for name in
+                    expand_inputs(args.freqfile, args.manifest)]
+        if run_incremental(args, 'modes', inputs, process,
+                           parameters(args, PARAMETERS)):
+            sys.exit(1)
+        return
+
+    # A single file is processed directly, with its output in the current
+    # directory.
+    if not batch:
+        try:
+            skipped, tot, written = process_file(freqfiles[0], args, '')
+        except ValueError as e:
+            sys.exit(str(e))
+        if args.vfreq == ['all']:
+            if skipped['negative']:
+                print('Skipped ', skipped['negative'],
+                      ' imaginary frequencies.')
+            if skipped['range']:
+                print('Skipped ', skipped['range'],
+                      ' out of range frequencies.')
+            print('The total number of normal modes is: ', tot)
+        return
+
+    # Many files are spread over a pool of workers, where a failing file
+    # does not stop the others.  With the cache of parsed files, the
+    # modes of every file are selected first and then split into chunks
+    # written independently, each reading the cached file.  A bundle is
+    # written as a whole, and without the cache each file would be
+    # parsed again for every chunk, so then a file is one task.
+    chunked = not (args.no_cache or (args.format != 'files' and
+                                     not args.trajectory))
+    if not chunked:
+        done = run_batch(partial(process_file, options=args), freqfiles,
+                         args.jobs)
+        results = [(name, result[:2]) for name, result, error in done
+                   if not error]
+    else:
+        planned = run_batch(partial(select_modes, options=args), freqfiles,
+                            args.jobs, progress=False)
+        results = []
+        chunks = []
+        for freqfile, plan, error in sorted(planned, key=lambda p: p[0]):
+            if not error:
+                selected, color, skipped, tot, entry = plan
+                results.append((freqfile, (skipped, tot)))
+                chunks.extend(split_modes(freqfile,
+                                          output_directory(freqfile, args),
+                                          selected, color, args.jobs, entry))
+        done = run_batch(partial(write_modes, options=args), chunks,
+                         args.jobs)
+
+    # Summarize the skipped modes of the whole batch.
+    if args.vfreq == ['all']:
+        negative = sum(skipped['negative'] for name, (skipped, tot) in results)
+        outside = sum(skipped['range'] for name, (skipped, tot) in results)
+        modes = sum(tot for name, (skipped, tot) in results)
+        print('Skipped {0} imaginary and {1} out of range frequencies of '
+              '{2} normal modes in {3} files.'.format(negative, outside,
+                                                      modes, len(results)))
+    if chunked:
+        failed = (report_failures(planned) +
+                  report_failures(done, noun='chunks of modes'))
+    else:
+        failed = report_failures(done)
+    if failed:
+        sys.exit(1)
+
+def process_file(freqfile, options, outdir=None):
+    """\
+    Select and write the modes of one frequency file, into `outdir` or
+    the directory of the file in a batch.  Returns the numbers of modes
+    skipped, the total number of modes and the files written.
+    """
+    with phase('parse'):
+        f = cache_from_options(options).collect(freqfile)
+    selected, color, skipped, tot, entry = select_modes(freqfile, options, f)
+    if outdir is None:
+        outdir = output_directory(freqfile, options)
+    written = write_modes(ModeChunk(freqfile, outdir, selected, color),
+                          options, f)
+    return skipped, tot, written
+
+def build_file(freqfile, options, outdir=None):
+    """\
+    Process one frequency file of an incremental build.  Returns the
+    files written.
+    """
+    return process_file(freqfile, options, outdir)[2]
+
+def select_modes(freqfile, options, f=None):
+    """\
+    Select the modes of a frequency file (parsed as `f`, if given)
+    requested by the options.  Returns a list of (index, name) pairs,
+    the color of the arrows, the numbers of modes skipped as imaginary
+    and out of range, the total number of modes, and the entry of the
+    file in the cache of parsed files when it was read from the cache.
+    """
+    from ..normalmodes import select_modes as select_frequencies
+
+    # Collect the data from the frequency file (or the cache of parsed
+    # files).  The entry is kept so the chunks of modes open it without
+    # hashing the file again.
+    entry = None
+    if f is None:
+        with phase('parse'):
+            cache = cache_from_options(options)
+            if cache.enabled:
+                entry = cache.entry(freqfile)
+            f = cache.collect(freqfile, entry)
+
+    # Select all the modes in range, or the requested ones.
+    if options.vfreq == ['all']:
+        requests = None
+        color = 'yellow'
+    elif 'all' in options.vfreq:
+        raise ValueError("'all' cannot be combined with other frequencies")
+    else:
+        requests = options.vfreq
+        color = None
+    with phase('select'):
+        selected, skipped, lookups = select_frequencies(f.v_frequencies,
+                                                        requests, options.low,
+                                                        options.high,
+                                                        options.tol)
+    tot = f.nmodes
+    count('modes', tot)
+    count('atoms', f.natoms)
+
+    # If a requested mode is degenerate, warn the user, but continue as
+    # normal.
+    warnfmt = '{0} {1} {2} {3}{4}'
+    for freq, degeneracy in lookups:
+        if degeneracy == 0:
+            print('Warning, there is no mode at frequency', freq)
+        elif degeneracy > 1:
+            print(warnfmt.format('Warning, the mode at frequency', str(freq),
+                                 'is', str(degeneracy), '-fold degenerate.'))
+            print("I'll make a file for each degenerate mode.")
+
+    return selected, color, skipped, tot, entry
+
+def output_directory(freqfile, options):
+    """\
+    Directory for the outputs of one frequency file of a batch, named
+    after the file.
+    """
+    stem = os.path.splitext(os.path.basename(freqfile))[0]
+    parent = options.outdir
+    if parent is None:
+        parent = os.path.dirname(freqfile)
+    return os.path.join(parent, stem + '_modes')
+
+class ModeChunk(object):
+    """\
+    Some of the selected modes of a frequency file, to be written to
+    `outdir` as a unit of work.  `entry` is the entry of the file in the
+    cache of parsed files, if it is known.
+    """
+
+    def __init__(self, freqfile, outdir, selected, color, entry=None):
+        self.freqfile = freqfile
+        self.outdir = outdir
+        self.selected = selected
+        self.color = color
+        self.entry = entry
+
+    def __str__(self):
+        if not self.selected:
+            return self.freqfile + ' (no modes)'
+        return '{0} ({1} to {2})'.format(self.freqfile, self.selected[0][1],
+                                         self.selected[-1][1])
+
+def split_modes(freqfile, outdir, selected, color, jobs, entry=None):
+    """\
+    Split the selected modes of a file into chunks for `jobs` workers.
+    """
+    size = max(8, -(-len(selected) // (4 * worker_count(jobs))))
+    return [ModeChunk(freqfile, outdir, selected[i:i+size], color, entry)
+            for i in range(0, max(len(selected), 1), size)]
+
+def write_modes(chunk, options, f=None):
+    """\
+    Write a trajectory or a TCL file per mode of the chunk, or all of
+    them to one bundle.  `f` is the parsed frequency file, if it is at
+    hand.  Returns the files written.
+    """
+    from ..normalmodes import scale_modes, write_mode_script, write_bundle, \
+                              mode_frames, write_trajectory
+    if f is None:
+        with phase('parse'):
+            f = cache_from_options(options).collect(chunk.freqfile,
+                                                    chunk.entry)
+    if chunk.outdir and not os.path.isdir(chunk.outdir):
+        try:
+            os.makedirs(chunk.outdir)
+        except OSError:
+            # Another worker made it first.
+            if not os.path.isdir(chunk.outdir):
+                raise
+    indices = [i for i, name in chunk.selected]
+    paths = [os.path.join(chunk.outdir, name) for i, name in chunk.selected]
+    scale = float(options.scale)
+    count('modes_written', len(indices))
+
+    if options.trajectory:
+        with phase('compute'):
+            frames = mode_frames(f.coordinates, f.normal_modes[indices],
+                                 options.frames, options.amplitude)
+        count('frames', frames.shape[0] * frames.shape[1])
+        symbols = getattr(f, 'atoms', None)
+        if symbols is None:
+            symbols = ['X'] * f.natoms
+        ext = TRAJECTORY_EXTENSIONS[options.trajectory]
+        for (i, name), path, trajectory in zip(chunk.selected, paths, frames):
+            comment = '{0} {1:.2f} cm-1'.format(name, f.v_frequencies[i])
+            with phase('write'):
+                write_trajectory(options.trajectory, path + ext, symbols,
+                                 trajectory, comment)
+        written = [path + ext for path in paths]
+        count_bytes(written)
+        return written
+
+    # Scale the displacements of the modes at once.
+    with phase('compute'):
+        displacements = scale_modes(f.normal_modes[indices], scale)
+    if options.format == 'files':
+        for path, displacement in zip(paths, displacements):
+            write_mode_script(path + '-vmd.tcl', f.coordinates, displacement,
+                              scale, chunk.color)
+        written = [path + '-vmd.tcl' for path in paths]
+        count_bytes(written)
+    else:
+        output = options.output
+        if output is None:
+            stem = os.path.splitext(os.path.basename(chunk.freqfile))[0]
+            if not chunk.outdir:
+                stem = os.path.splitext(chunk.freqfile)[0]
+            output = os.path.join(chunk.outdir,
+                                  stem + BUNDLE_EXTENSIONS[options.format])
+        with phase('write'):
+            write_bundle(options.format, output, f.coordinates,
+                         displacements, f.v_frequencies[indices],
+                         [name for i, name in chunk.selected], scale,
+                         chunk.color)
+        written = [output]
+        count_bytes(written)
+    return written
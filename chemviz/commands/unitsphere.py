@@ -0,0 +1,230 @@
+"""\
+The unitsphere command (generate_unitsphere.py): unit sphere
+representations of (hyper)polarizabilities.
+"""
+
+from __future__ import print_function, division
+import sys, os
+from ..choices import GRID_NAMES, COLORMAPS, MAX_BINS, EXTENSIONS, \
+                       STACKED_FORMATS
+from ..batch import expand_inputs, run_batch, report_failures
+from ..parsecache import add_cache_arguments, cache_from_options
+from ..profiling import add_profile_arguments, check_profile_arguments, \
+                         profiled, phase, count, count_bytes
+from ..incremental import add_incremental_arguments, \
+                          check_incremental_arguments, run_incremental, \
+                          parameters
+from functools import partial
+
+# Options that shape the outputs, recorded for incremental builds.
+PARAMETERS = ('radius', 'output', 'grid', 'resolution', 'colormap', 'bins',
+              'format')
+
+def main(argv=None, prog=None):
+    """\
+    This program takes the polarizability or hyperpolarizablity 
+    and contracts it with the incident electic field(s).  It is
+    used to generate a unit sphere representation at the ground
+    state optimized geometry. 
+    """
+
+    from argparse import ArgumentParser, RawDescriptionHelpFormatter
+    from textwrap import dedent
+    parser = ArgumentParser(prog=prog,
+                            description=dedent(main.__doc__),
+                            formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument('--version', action='version', version='%(prog)s 1.0')
+    parser.add_argument('polfile', help='Output file(s) of a polarizability '
+                        'or hyperpolarizability calculation.  Glob patterns '
+                        'are expanded.', nargs='*')
+    parser.add_argument('--manifest', help='File listing further output files '
+                        '(or glob patterns), one per line.', required=False)
+    parser.add_argument('-j', '--jobs', help='Number of worker processes used '
+                        'for many files (0 uses all cores).', default=1,
+                        type=int)
+    parser.add_argument('-r', '--radius', help='Radius of the sphere for '
+                        'making images.', required=False, default=1.0,
+                        type=float)
+    parser.add_argument('-o', '--output', help='Name of the output file.',
+                        required=False)
+    parser.add_argument('-g', '--grid', help='Kind of grid of field '
+                        'directions.', choices=sorted(GRID_NAMES),
+                        default='lattice')
+    parser.add_argument('--resolution', help='Resolution of the grid: the '
+                        'angular step in degrees for the lattice (default 10), '
+                        'or the number of points for the Fibonacci sphere '
+                        '(default 648).', type=float, required=False)
+    parser.add_argument('--grid-cache', help='Directory in which to cache '
+                        'grids between runs.', required=False)
+    parser.add_argument('--colormap', help='Color map for the vector '
+                        'magnitudes.', choices=sorted(COLORMAPS), default='bwr')
+    parser.add_argument('--bins', help='Number of colors the magnitudes are '
+                        'binned into.', default=21, type=int)
+    parser.add_argument('-f', '--format', help='Output format: a VMD TCL '
+                        'script, a NumPy archive, a binary PLY point set, or '
+                        'a group per molecule in an HDF5 file.',
+                        choices=sorted(EXTENSIONS), default='tcl')
+    add_cache_arguments(parser)
+    add_incremental_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    check_incremental_arguments(parser, args)
+    check_profile_arguments(parser, args)
+    if not 1 <= args.bins <= MAX_BINS:
+        parser.error('The number of bins must be between 1 and {0}.'
+                     .format(MAX_BINS))
+    if args.resolution is not None:
+        if args.grid == 'lattice' and not 0 < args.resolution <= 180:
+            parser.error('The resolution of the lattice must be an angular '
+                         'step between 0 and 180 degrees.')
+        if args.grid == 'fibonacci' and (args.resolution < 1 or
+                                         args.resolution % 1):
+            parser.error('The resolution of the Fibonacci sphere must be a '
+                         'positive number of points.')
+    with profiled(args, 'unitsphere'):
+        run(args, parser)
+
+def run(args, parser):
+    """\
+    Run the command with the parsed options.
+    """
+    # Expand the list of files to process.
+    polfiles = expand_inputs(args.polfile, args.manifest)
+    if not polfiles:
+        parser.error('No polarizability files were given.')
+    if args.output and len(polfiles) > 1:
+        # Only HDF5 can gather many molecules into one file, and HDF5
+        # files cannot be written from several processes at once.
+        if args.format != 'hdf5':
+            parser.error('--output can only be used with a single file, '
+                         'except with --format hdf5.')
+        args.jobs = 1
+    args.groups = molecule_groups(polfiles, args.output)
+    if args.output and len(set(args.groups.values())) < len(polfiles):
+        parser.error('Some files would have the same HDF5 group in '
+                     + args.output + '.')
+    if not args.output:
+        check_output_names(parser, polfiles)
+
+    # Only the files that changed since the last run, or whose outputs
+    # are missing, are processed, and possibly new files as they come.
+    if args.incremental:
+        process = partial(run_batch, partial(unitsphere, options=args),
+                          jobs=args.jobs)
+        def inputs():
+            names = expand_inputs(args.polfile, args.manifest)
+            args.groups = molecule_groups(names, args.output)
+            return [(name, [name]) for name in names]
+        if run_incremental(args, 'unitsphere', inputs, process,
+                           parameters(args, PARAMETERS)):
+            sys.exit(1)
+        return
+
+    # A single file is processed directly.  Many files are spread over
+    # a pool of workers, where a failing file does not stop the others.
+    if len(polfiles) == 1:
+        unitsphere(polfiles[0], args)
+    else:
+        done = run_batch(partial(unitsphere, options=args), polfiles,
+                         args.jobs)
+        if report_failures(done):
+            sys.exit(1)
+
+def molecule_groups(polfiles, shared=False):
+    """\
+    Name of the HDF5 group of each file: the name of the molecule, from
+    the file name.  When the groups are `shared` in one output file and
+    several files have the same name, their paths from their common
+    directory without the extension are used instead.
+    """
+    names = dict((polfile, os.path.basename(polfile).split('.')[0])
+                 for polfile in polfiles)
+    if not shared:
+        return names
+    taken = {}
+    for polfile, name in names.items():
+        taken.setdefault(name, []).append(polfile)
+    for name, same in taken.items():
+        if len(same) > 1:
+            common = os.path.commonpath([os.path.abspath(os.path.dirname(f))
+                                         for f in same])
+            for polfile in same:
+                path = os.path.relpath(os.path.abspath(polfile), common)
+                names[polfile] = os.path.splitext(path)[0].replace(os.sep,
+                                                                   '/')
+    return names
+
+def check_output_names(parser, polfiles):
+    """\
+    Stop if several files would write the same outputs: their names
+    differ only by the extension.
+    """
+    stems = {}
+    for polfile in polfiles:
+        stem = os.path.splitext(os.path.abspath(polfile))[0]
+        if stem in stems:
+            parser.error('{0} and {1} would have the same output files.'
+                         .format(stems[stem], polfile))
+        stems[stem] = polfile
+
+def output_name(polfile, options, suffix, only=True):
+    """\
+    Name of the output file for the tensor with the given file suffix.
+    A user-given output name is used as it is for the only tensor of a
+    file, and as the stem when there are several.
+    """
+    if options.output:
+        if only or not suffix:
+            return options.output
+        root, ext = os.path.splitext(options.output)
+        return root + '_' + suffix + ext
+    parts = [os.path.splitext(polfile)[0], suffix, 'unitsphere']
+    return '_'.join(p for p in parts if p) + EXTENSIONS[options.format]
+
+def unitsphere(polfile, options):
+    """\
+    Contract the (hyper)polarizabilities of a single output file with the
+    electric field(s) and write the unit sphere representation.  Returns
+    the names of the files written.
+    """
+
+    from ..unitsphere import sphere_fields
+    from ..sphereexport import export_field, export_stack
+
+    # Collect data from the output file (or the cache of parsed files).
+    with phase('parse'):
+        data = cache_from_options(options).collect(polfile)
+    written = []
+
+    # Name of the molecule, for the HDF5 group.
+    molecule = options.groups[polfile]
+
+    # Contract every tensor of the output (all frequencies of every type)
+    # with the electric field(s) on the requested grid.
+    with phase('compute'):
+        names, origins, fields, norms = sphere_fields(data, options.grid,
+                                                      options.resolution,
+                                                      options.radius,
+                                                      options.grid_cache)
+    count('fields', len(names))
+    count('grid_points', len(origins))
+
+    # Output the data to TCL scripts, to use with VMD (the extension is
+    # irrelevant), or to one of the binary formats.  The NumPy and HDF5
+    # formats hold every tensor in one file, the others get a file per
+    # tensor.
+    if options.format in STACKED_FORMATS:
+        outfile = output_name(polfile, options, '')
+        export_stack(options.format, outfile, origins, fields, norms,
+                     [label for label, suffix in names], molecule,
+                     getattr(data, 'e_frequencies', None))
+        written.append(outfile)
+    else:
+        for i, (label, suffix) in enumerate(names):
+            outfile = output_name(polfile, options, suffix, len(names) == 1)
+            export_field(options.format, outfile, origins, fields[i],
+                         norms[i], options.colormap, options.bins)
+            written.append(outfile)
+
+    count_bytes(written)
+    return written
@@ -0,0 +1,198 @@
+"""\
+Arithmetic expressions over several cube files, such as
+"0.5*abs(a)**2 - abs(b)**2 + c".  The cubes are bound to the names a, b,
+c, ... in the order they are given.  Expressions are checked against a
+small whitelist before they are evaluated, and are evaluated slab by
+slab with numexpr when it is installed (which fuses the whole expression
+into one pass), or otherwise with NumPy ufuncs writing in place into the
+result and a few scratch slabs kept between slabs, so an operator does
+not allocate a temporary.
+"""
+
+from __future__ import print_function, division
+from string import ascii_lowercase
+import ast
+import threading
+import numpy
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+# Elementwise functions that may be used in an expression, one for each
+# of choices.FUNCTION_NAMES.
+FUNCTIONS = {
+    'abs' : numpy.absolute,
+    'sqrt' : numpy.sqrt,
+    'exp' : numpy.exp,
+    'log' : numpy.log,
+    'log10' : numpy.log10,
+    'sin' : numpy.sin,
+    'cos' : numpy.cos,
+    'tan' : numpy.tan,
+    'tanh' : numpy.tanh,
+}
+
+# Names the cubes are bound to, in order.
+CUBE_NAMES = tuple(ascii_lowercase)
+
+# The ufunc of each operator.
+_OPERATORS = {
+    ast.Add : numpy.add,
+    ast.Sub : numpy.subtract,
+    ast.Mult : numpy.multiply,
+    ast.Div : numpy.true_divide,
+    ast.Pow : numpy.power,
+    ast.USub : numpy.negative,
+}
+
+_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name,
+          ast.Load, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub,
+          ast.UAdd, ast.Constant)
+
+
+class CubeExpression(object):
+    """\
+    A checked expression over cubes.  `names` lists the cube names it
+    uses, in alphabetical order.
+    """
+
+    def __init__(self, expr, ncubes):
+        self.expr = expr
+        self.ncubes = ncubes
+        try:
+            tree = ast.parse(expr.strip(), mode='eval')
+        except SyntaxError as e:
+            raise ValueError('Invalid expression: ' + str(e))
+        names = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, _NODES):
+                raise ValueError('Not allowed in an expression: '
+                                 + type(node).__name__)
+            if isinstance(node, ast.Constant):
+                if not isinstance(node.value, (int, float)):
+                    raise ValueError('Only numbers are allowed as constants')
+            elif isinstance(node, ast.Call):
+                if (not isinstance(node.func, ast.Name) or node.keywords or
+                    node.func.id not in FUNCTIONS or len(node.args) != 1):
+                    raise ValueError('Only the functions ' +
+                                     ', '.join(sorted(FUNCTIONS)) +
+                                     ' of one argument are allowed')
+            elif isinstance(node, ast.Name) and node.id not in FUNCTIONS:
+                if node.id not in CUBE_NAMES[:ncubes]:
+                    raise ValueError('Unknown name ' + node.id + ' (there '
+                                     'are ' + str(ncubes) + ' cubes)')
+                names.add(node.id)
+        if not names:
+            raise ValueError('The expression does not use any cube')
+        self.names = sorted(names)
+        self.tree = tree.body
+        self.constants = {}
+        self._fold(self.tree)
+        self._scratch = threading.local()
+
+    def _fold(self, node):
+        """\
+        Work out the value of every largest part of the expression under
+        `node` without cubes, into `constants`.  Returns whether `node`
+        itself is without cubes.
+        """
+        if isinstance(node, ast.Name):
+            return node.id in FUNCTIONS
+        children = list(ast.iter_child_nodes(node))
+        constant = [self._fold(child) for child in children]
+        if all(constant):
+            return True
+        for child, value in zip(children, constant):
+            if value and not isinstance(child, (ast.Name, ast.operator,
+                                                ast.unaryop)):
+                code = compile(ast.Expression(child), '<expression>', 'eval')
+                self.constants[child] = eval(code, {'__builtins__' : {}},
+                                             dict(FUNCTIONS))
+        return False
+
+    def __reduce__(self):
+        # The scratch slabs cannot be pickled, so workers parse again.
+        return (CubeExpression, (self.expr, self.ncubes))
+
+    def indices(self):
+        """Positions of the cubes used, in the order of `names`."""
+        return [CUBE_NAMES.index(name) for name in self.names]
+
+    def __call__(self, slabs):
+        """\
+        Evaluate the expression for one slab of every cube used, given in
+        the order of `names`.
+        """
+        local = dict(zip(self.names, slabs))
+        if numexpr is not None:
+            return numexpr.evaluate(self.expr, local_dict=local,
+                                    global_dict={})
+        if isinstance(self.tree, ast.Name):
+            return local[self.tree.id]
+        out = numpy.empty(numpy.shape(slabs[0]),
+                          numpy.result_type(float, *slabs))
+        # Scratch slabs are kept per thread, for workers on threads.
+        scratch = getattr(self._scratch, 'slabs', None)
+        if (not scratch or scratch[0].shape != out.shape or
+            scratch[0].dtype != out.dtype):
+            scratch = self._scratch.slabs = [out]
+        scratch[0] = out
+        return self._evaluate(self.tree, local, scratch, 0)
+
+    def _evaluate(self, node, local, scratch, depth):
+        """\
+        Evaluate `node`, an operation on at least one cube, into
+        scratch[depth], using the scratch slabs after it for the operands
+        that need one.
+        """
+        out = scratch[depth]
+        if isinstance(node, ast.BinOp):
+            left = self._operand(node.left, local, scratch, depth)
+            right = self._operand(node.right, local, scratch, depth + 1)
+            return _OPERATORS[type(node.op)](left, right, out=out)
+        if isinstance(node, ast.UnaryOp):
+            operand = self._operand(node.operand, local, scratch, depth)
+            if isinstance(node.op, ast.UAdd):
+                numpy.copyto(out, operand)
+                return out
+            return numpy.negative(operand, out=out)
+        operand = self._operand(node.args[0], local, scratch, depth)
+        return FUNCTIONS[node.func.id](operand, out=out)
+
+    def _operand(self, node, local, scratch, depth):
+        """\
+        The value of `node` as an operand: a cube slab or a number as
+        they are, or otherwise evaluated into scratch[depth].
+        """
+        if isinstance(node, ast.Name):
+            return local[node.id]
+        if node in self.constants:
+            return self.constants[node]
+        while len(scratch) <= depth:
+            scratch.append(numpy.empty_like(scratch[0]))
+        return self._evaluate(node, local, scratch, depth)
+
+
+def mo_expression(ncubes, expr=None, difference=False, scale=1.0):
+    """\
+    The expression for one of the operations on MO cubes: `expr` if it
+    is given, the difference of the absolute values of two cubes (the
+    way other codes take it) if `difference` is set, or otherwise the
+    first cube.  A scale factor other than 1 multiplies the result.
+    Returns the CubeExpression.
+    """
+    if not expr and difference:
+        # It is debatable whether this is the correct method for taking
+        # differences, since the lobes of the MOs can be positive or
+        # negative.
+        if ncubes != 2:
+            raise ValueError('The difference needs exactly two cube files')
+        expr = 'abs(a) - abs(b)'
+    elif not expr:
+        expr = 'a'
+    scale = float(scale)
+    if scale != 1.0:
+        expr = '({0}) * {1!r}'.format(expr, scale)
+    return CubeExpression(expr, ncubes)
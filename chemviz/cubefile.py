@@ -0,0 +1,438 @@
+"""\
+Streaming access to Gaussian cube files.  The header is parsed on its
+own and the volumetric data is read and written in slabs of planes along
+the first axis, so memory use does not depend on the size of the grid.
+"""
+
+from __future__ import print_function, division
+from numpy import array, asarray, fromstring, empty, arange, where
+from numpy import absolute, isfinite, floor, log10, rint, signbit
+from numpy import maximum, flatnonzero, dtype, int64, uint8
+from itertools import islice
+from collections import deque
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from .batch import worker_count
+from .profiling import phase, count
+from .choices import DEFAULT_PLANES
+
+# Number of values per line in the data section.
+PER_LINE = 6
+
+
+class CubeHeader(object):
+    """\
+    The header of a Gaussian cube file: the two comment lines, the
+    origin, the grid shape and axis vectors, the atoms and (for MO
+    cubes) the list of orbitals.  The raw lines are kept so the header
+    can be copied verbatim.
+    """
+
+    def __init__(self, lines):
+        self.lines = list(lines)
+        fields = self.lines[2].split()
+        self.natoms = int(fields[0])
+        self.origin = array([float(x) for x in fields[1:4]])
+        self.shape = tuple(int(self.lines[3+i].split()[0]) for i in range(3))
+        self.axes = array([[float(x) for x in self.lines[3+i].split()[1:4]]
+                           for i in range(3)])
+        self.atoms = array([[float(x) for x in line.split()[:5]]
+                            for line in self.lines[6:6+abs(self.natoms)]])
+        # MO cubes (negative number of atoms) have one value per orbital
+        # at each point; otherwise an optional fifth field gives it.
+        if self.natoms < 0:
+            self.nvalues = int(self.lines[6+abs(self.natoms)].split()[0])
+        elif len(fields) > 4:
+            self.nvalues = int(fields[4])
+        else:
+            self.nvalues = 1
+
+    @property
+    def runlength(self):
+        """Number of values written for each (i, j) pair of the grid."""
+        return self.shape[2] * self.nvalues
+
+    @property
+    def lines_per_run(self):
+        """Number of data lines for each (i, j) pair of the grid."""
+        return -(-self.runlength // PER_LINE)
+
+    def text(self):
+        """The header as it appears in the file."""
+        return ''.join(self.lines)
+
+    def downsampled(self, factor):
+        """\
+        Header of the grid made by averaging blocks of factor**3 points:
+        the shape is divided by `factor` (dropping incomplete blocks),
+        the axis vectors are multiplied by it, and the origin moves to
+        the center of the first block.
+        """
+        fields = self.lines[2].split()
+        origin = self.origin + 0.5 * (factor - 1) * self.axes.sum(axis=0)
+        lines = self.lines[:2]
+        lines.append('{0:5d} {1:11.6f} {2:11.6f} {3:11.6f}'.format(
+                     self.natoms, *origin) +
+                     ''.join(' ' + f for f in fields[4:]) + '\n')
+        for n, axis in zip(self.shape, self.axes):
+            lines.append('{0:5d} {1:11.6f} {2:11.6f} {3:11.6f}\n'.format(
+                         n // factor, *(axis * factor)))
+        lines.extend(self.lines[6:])
+        return CubeHeader(lines)
+
+    def compatible(self, other, tol=1E-6):
+        """\
+        Whether the data of `other` lies on the same grid as this one.
+        """
+        return (self.shape == other.shape and
+                self.nvalues == other.nvalues and
+                abs(self.origin - other.origin).max() <= tol and
+                abs(self.axes - other.axes).max() <= tol)
+
+
+def read_header(fh):
+    """\
+    Read the header of a cube file from the open file `fh`, leaving the
+    file positioned at the start of the data.
+    """
+    lines = list(islice(fh, 6))
+    if len(lines) < 6:
+        raise ValueError('Truncated cube file header')
+    natoms = int(lines[2].split()[0])
+    lines.extend(islice(fh, abs(natoms)))
+    # The orbital list of MO cubes can span several lines.
+    if natoms < 0:
+        line = next(fh)
+        lines.append(line)
+        nmo = int(line.split()[0])
+        tokens = len(line.split())
+        while tokens < nmo + 1:
+            line = next(fh)
+            lines.append(line)
+            tokens += len(line.split())
+    return CubeHeader(lines)
+
+
+def iter_slab_text(fh, header, planes=DEFAULT_PLANES):
+    """\
+    Yield the unparsed text of consecutive slabs of at most `planes`
+    planes along the first axis.  `fh` must be positioned at the start
+    of the data.
+    """
+    n1, n2, n3 = header.shape
+    planes = max(1, int(planes))
+    for start in range(0, n1, planes):
+        k = min(planes, n1 - start)
+        yield ''.join(islice(fh, k * n2 * header.lines_per_run))
+
+
+def parse_slab(text, header):
+    """\
+    Parse the text of a slab into an array of shape (k, n2, runlength).
+    """
+    values = fromstring(text, sep=' ')
+    n2 = header.shape[1]
+    k, left = divmod(values.size, n2 * header.runlength)
+    if left or not k:
+        raise ValueError('Truncated cube file data')
+    return values.reshape(k, n2, header.runlength)
+
+
+def iter_slabs(fh, header, planes=DEFAULT_PLANES):
+    """\
+    Yield the data of the cube as arrays of shape (k, n2, runlength), for
+    consecutive slabs of at most `planes` planes along the first axis.
+    `fh` must be positioned at the start of the data.
+    """
+    for text in iter_slab_text(fh, header, planes):
+        yield parse_slab(text, header)
+
+
+# Pieces of the ' %12.5E' layout: the sign, leading digit and point,
+# the five decimals and the exponent, each looked up from a table.
+_HEADS = array([s + str(d) + '.' for s in ' -' for d in range(10)], dtype='S3')
+_DECIMALS = None # Built on first use, see _scientific.
+_EXPONENTS = array(['E%+03d' % i for i in range(-99, 100)], dtype='S4')
+_LAYOUT = dtype([('space', 'S1'), ('head', 'S3'), ('decimals', 'S5'),
+                 ('exponent', 'S4')])
+
+# Powers of ten used to scale values to a six-digit mantissa.
+_POWERS = 10.0**arange(200)
+
+
+def _scientific(values):
+    """\
+    Format every value as ' %12.5E' would, returning a (nvalues, 13)
+    array of characters, or None if some value is not finite or has a
+    three-digit exponent (those are left to the % formatting).
+    """
+    global _DECIMALS
+    if _DECIMALS is None:
+        _DECIMALS = array(['%05d' % i for i in range(100000)], dtype='S5')
+    values = asarray(values, dtype=float).ravel()
+    if not isfinite(values).all():
+        return None
+    mag = absolute(values)
+    nonzero = mag > 0.0
+    exponent = floor(log10(where(nonzero, mag, 1.0))).astype(int64)
+    if absolute(exponent).max(initial=0) >= 99:
+        return None
+
+    # Scale to a six-digit integer mantissa, multiplying or dividing by
+    # a power of ten (the other factor is one, so there is a single
+    # rounding).  log10 can be off by one next to powers of ten, and
+    # rounding up can carry into a seventh digit; both are fixed up
+    # afterwards.
+    def scaled(mag, exponent):
+        shift = 5 - exponent
+        return mag * _POWERS[maximum(shift, 0)] / _POWERS[maximum(-shift, 0)]
+    mantissa = scaled(mag, exponent)
+    low = nonzero & (mantissa < 99999.5)
+    exponent[low] -= 1
+    mantissa[low] = scaled(mag[low], exponent[low])
+    digits = rint(mantissa).astype(int64)
+    high = digits >= 1000000
+    exponent[high] += 1
+    digits[high] //= 10
+
+    # Values that land exactly halfway after scaling may have been
+    # rounded twice; take those few from the exact Python formatting.
+    for i in flatnonzero(mantissa - floor(mantissa) == 0.5):
+        text, power = ('%.5E' % mag[i]).split('E')
+        digits[i] = int(text.replace('.', ''))
+        exponent[i] = int(power)
+
+    lead, decimals = divmod(digits, 100000)
+    chars = empty(values.size, dtype=_LAYOUT)
+    chars['space'] = b' '
+    chars['head'] = _HEADS[signbit(values) * 10 + lead]
+    chars['decimals'] = _DECIMALS[decimals]
+    chars['exponent'] = _EXPONENTS[exponent + 99]
+    return chars.view(uint8).reshape(values.size, 13)
+
+
+def format_slab(slab):
+    """\
+    Format a slab of cube data with shape (..., runlength) as bytes, six
+    values per line with each run starting on a new line.  The digits
+    are assembled with array operations; slabs with values that do not
+    fit the fixed-width layout fall back to % formatting.
+    """
+    slab = asarray(slab, dtype=float)
+    runlength = slab.shape[-1]
+    nruns = slab.size // runlength
+    numrows, remainder = divmod(runlength, PER_LINE)
+    chars = _scientific(slab)
+    if chars is None:
+        fmt = (' %12.5E' * PER_LINE + '\n') * numrows
+        if remainder:
+            fmt += ' %12.5E' * remainder + '\n'
+        text = (fmt * nruns) % tuple(slab.ravel().tolist())
+        return text.encode('ascii')
+
+    # Lay out the full lines of six values and the shorter remainder
+    # line of every run, each followed by a newline.
+    chars = chars.reshape(nruns, runlength * 13)
+    width = PER_LINE * 13 + 1
+    lines = empty((nruns, numrows * width + (remainder * 13 + 1 if remainder
+                                             else 0)), dtype=uint8)
+    full = lines[:, :numrows*width].reshape(nruns, numrows, width)
+    full[:,:,:-1] = chars[:, :numrows*(width-1)].reshape(nruns, numrows,
+                                                          width - 1)
+    full[:,:,-1] = ord('\n')
+    if remainder:
+        lines[:, numrows*width:-1] = chars[:, numrows*(width-1):]
+        lines[:, -1] = ord('\n')
+    return lines.tobytes()
+
+
+def write_cube(filename, header, data, planes=DEFAULT_PLANES):
+    """\
+    Write a complete cube file: the header followed by `data`, an array
+    of shape (n1, n2, runlength) (or anything that reshapes to it), in
+    the six-per-line layout.
+    """
+    n1, n2, n3 = header.shape
+    data = asarray(data).reshape(n1, n2, header.runlength)
+    with open(filename, 'wb') as out:
+        out.write(header.text().encode('ascii'))
+        for start in range(0, n1, planes):
+            out.write(format_slab(data[start:start+planes]))
+
+
+def _use_cache(filename, cache):
+    """\
+    Whether to take a cube file from a ParseCache: only if the cache is
+    enabled and the data of the cube fits in it, so large cubes are
+    always streamed from the text.
+    """
+    if cache is None or not cache.enabled:
+        return False
+    with open(filename) as fh:
+        header = read_header(fh)
+    n1, n2, n3 = header.shape
+    return n1 * n2 * header.runlength * dtype(float).itemsize <= \
+           cache.max_size
+
+
+def open_cube(filename, planes=DEFAULT_PLANES, cache=None, parse=True):
+    """\
+    Open a cube file for streaming.  Returns its header and an iterator
+    over its slabs.  With an enabled ParseCache the data of a cube that
+    fits in it comes from the memory-mapped cache entry, which is built
+    on the first use.  Otherwise, if `parse` is false, the slabs are
+    left as text for parse_slab, so they can be parsed elsewhere.
+    """
+    if _use_cache(filename, cache):
+        with phase('parse'):
+            header, data = cache.cube(filename, planes)
+        return header, (data[i:i+planes] for i in range(0, len(data), planes))
+
+    fh = open(filename)
+    header = read_header(fh)
+    def slabs():
+        with fh:
+            for text in iter_slab_text(fh, header, planes):
+                yield parse_slab(text, header) if parse else text
+    return header, slabs()
+
+
+def read_cube(filename, planes=DEFAULT_PLANES, cache=None):
+    """\
+    Read a whole cube file into memory.  Returns its header and its data
+    as an array of shape (n1, n2, runlength), memory-mapped when it
+    comes from an enabled ParseCache it fits in.
+    """
+    if _use_cache(filename, cache):
+        return cache.cube(filename, planes)
+    with open(filename) as fh:
+        header = read_header(fh)
+        n1, n2, n3 = header.shape
+        data = empty((n1, n2, header.runlength))
+        start = 0
+        for slab in iter_slabs(fh, header, planes):
+            data[start:start+len(slab)] = slab
+            start += len(slab)
+    return header, data
+
+
+def combine_cubes(func, cubes):
+    """\
+    Combine cubes held in memory, given as a list of (header, data)
+    pairs on the same grid.  func(arrays) gets the data of every cube
+    and returns the combined data.  Returns the header of the first
+    cube and the combined data.
+    """
+    headers = [header for header, data in cubes]
+    for i, header in enumerate(headers[1:]):
+        if not headers[0].compatible(header):
+            raise ValueError('Cube {0} is not on the same grid as cube '
+                             '0'.format(i + 1))
+    return headers[0], func([data for header, data in cubes])
+
+
+def _combine_slab(task):
+    """\
+    Parse (where needed), combine and format one slab of every cube;
+    the unit of work of stream_combine.
+    """
+    func, header, sources = task
+    slabs = [parse_slab(s, header) if isinstance(s, str) else s
+             for s in sources]
+    return format_slab(func(slabs))
+
+
+def open_cubes(filenames, planes=DEFAULT_PLANES, cache=None, parse=True):
+    """\
+    open_cube every file, checking that they are all on the same grid.
+    Returns the header of the first file and a list with the slab
+    iterator of every file.
+    """
+    cubes = [open_cube(name, planes, cache, parse) for name in filenames]
+    headers = [header for header, slabs in cubes]
+    for name, header in zip(filenames[1:], headers[1:]):
+        if not headers[0].compatible(header):
+            raise ValueError(name + ' is not on the same grid as '
+                             + filenames[0])
+    return headers[0], [slabs for header, slabs in cubes]
+
+
+def _next_slabs(slabs):
+    """\
+    The next slab of every iterator in `slabs`, or None at the end.
+    """
+    with phase('parse'):
+        current = [next(it, None) for it in slabs]
+    return None if current[0] is None else current
+
+
+def _combined(func, slabs):
+    """\
+    Yield func(slabs) for the current slab of every cube in turn.
+    """
+    slabs = [iter(it) for it in slabs]
+    current = _next_slabs(slabs)
+    while current is not None:
+        with phase('compute'):
+            combined = func(current)
+        count('voxels', combined.size)
+        yield combined
+        current = _next_slabs(slabs)
+
+
+def combine_slabs(func, filenames, planes=DEFAULT_PLANES, cache=None):
+    """\
+    Combine the data of several cube files on the same grid slab by
+    slab, as stream_combine does, but yield the combined slabs instead
+    of writing them.  Returns the header of the first file and the
+    iterator over the combined slabs.
+    """
+    header, slabs = open_cubes(filenames, planes, cache)
+    return header, _combined(func, slabs)
+
+
+def stream_combine(func, filenames, out, planes=DEFAULT_PLANES, cache=None,
+                   jobs=1, threads=False):
+    """\
+    Combine the data of several cube files on the same grid slab by
+    slab.  func(slabs) gets a list with the current slab of every file
+    and returns the combined slab.  The header of the first file and
+    the combined data are written to `out`, opened in binary mode.
+    Returns the header of the first file.
+
+    With more than one job the slabs are parsed, combined and formatted
+    on a pool of processes (or threads), each into its own buffer, and
+    the buffers are written in order.  Only a few slabs per worker are
+    in flight at any time, so memory use stays bounded.  `func` must be
+    picklable to use processes.
+    """
+    jobs = worker_count(jobs)
+    header, slabs = open_cubes(filenames, planes, cache, parse=(jobs == 1))
+    out.write(header.text().encode('ascii'))
+
+    if jobs == 1:
+        for combined in _combined(func, slabs):
+            with phase('format'):
+                text = format_slab(combined)
+            with phase('write'):
+                out.write(text)
+        return header
+
+    # The workers parse, compute and format, so their time is only seen
+    # as a whole here.
+    tasks = ((func, header, list(current)) for current in zip(*slabs))
+    n1, n2, n3 = header.shape
+    count('voxels', n1 * n2 * header.runlength)
+    pool = (ThreadPool if threads else Pool)(jobs)
+    try:
+        with phase('workers'):
+            pending = deque()
+            for task in tasks:
+                pending.append(pool.apply_async(_combine_slab, (task,)))
+                if len(pending) >= 2 * jobs:
+                    out.write(pending.popleft().get())
+            while pending:
+                out.write(pending.popleft().get())
+    finally:
+        pool.terminate()
+    return header
@@ -0,0 +1,179 @@
+"""\
+Lighter representations of large cubes for visualization: a pyramid of
+block-averaged cubes at lower resolutions, and isosurface meshes written
+as OBJ or binary PLY.  Both are built from a stream of slabs, in one
+pass over the input.
+"""
+
+from __future__ import print_function, division
+from numpy import asarray, concatenate, empty, zeros, dot, lcm
+from .cubefile import format_slab
+from .profiling import phase
+
+# Vertex colors of the positive and negative lobes in PLY meshes.
+LOBE_COLORS = { 'positive' : (255, 0, 0), 'negative' : (0, 0, 255) }
+
+
+def lod_planes(planes, factors):
+    """\
+    Round the number of planes per slab up to a multiple of every
+    factor, so no averaging block straddles two slabs.
+    """
+    step = int(lcm.reduce([int(f) for f in factors])) if factors else 1
+    return -(-int(planes) // step) * step
+
+
+def block_average(slab, factor, nvalues=1):
+    """\
+    Average blocks of factor**3 points of a slab of shape (k, n2,
+    n3*nvalues), each value of a point separately.  Incomplete blocks
+    at the ends of the axes are dropped.
+    """
+    k, n2, run = slab.shape
+    n3 = run // nvalues
+    a, b, c = k // factor, n2 // factor, n3 // factor
+    data = asarray(slab).reshape(k, n2, n3, nvalues)
+    data = data[:a*factor, :b*factor, :c*factor]
+    data = data.reshape(a, factor, b, factor, c, factor, nvalues)
+    return data.mean(axis=(1, 3, 5)).reshape(a, b, c * nvalues)
+
+
+def build_lod(header, slabs, outputs, volume_factor=None):
+    """\
+    Write a block-averaged cube for every factor in `outputs`, a dict
+    of factor to file name, from the stream of slabs of the cube with
+    `header`.  The slabs must hold a multiple of every factor (see
+    lod_planes), except the last.  If `volume_factor` is given, the
+    data averaged by that factor is also kept in memory and returned
+    with its header, for isosurfaces; otherwise (None, None) is
+    returned.
+    """
+    files = {}
+    volume = []
+    try:
+        for factor, filename in outputs.items():
+            files[factor] = open(filename, 'wb')
+            files[factor].write(header.downsampled(factor).text()
+                                .encode('ascii'))
+        for slab in slabs:
+            for factor, out in files.items():
+                with phase('compute'):
+                    averaged = block_average(slab, factor, header.nvalues)
+                if averaged.size:
+                    with phase('format'):
+                        text = format_slab(averaged)
+                    with phase('write'):
+                        out.write(text)
+            with phase('compute'):
+                if volume_factor == 1:
+                    volume.append(asarray(slab, dtype=float))
+                elif volume_factor:
+                    volume.append(block_average(slab, volume_factor,
+                                                header.nvalues))
+    finally:
+        for out in files.values():
+            out.close()
+
+    if not volume_factor:
+        return None, None
+    return header.downsampled(volume_factor), concatenate(volume)
+
+
+def isosurface(volume, header, level):
+    """\
+    Extract the isosurface at `level` of a volume with shape (n1, n2, n3)
+    by marching cubes.  Returns the vertices, in the Cartesian frame of
+    the cube, and the triangles as vertex indices.  Requires
+    scikit-image.
+    """
+    try:
+        from skimage.measure import marching_cubes
+    except ImportError:
+        raise ImportError('Isosurfaces require the scikit-image package')
+    if not volume.min() < level < volume.max():
+        return empty((0, 3)), empty((0, 3), dtype=int)
+    verts, faces = marching_cubes(volume, level)[:2]
+    return header.origin + dot(verts, header.axes), faces
+
+
+def lobes(volume, header, isovalue):
+    """\
+    The positive and negative lobes of a single-valued volume, as a list
+    of (name, vertices, faces) for the isosurfaces at +isovalue and
+    -isovalue.
+    """
+    if header.nvalues != 1:
+        raise ValueError('Isosurfaces need a cube with one value per point')
+    isovalue = abs(float(isovalue))
+    surfaces = []
+    for name, level in (('positive', isovalue), ('negative', -isovalue)):
+        verts, faces = isosurface(volume, header, level)
+        surfaces.append((name, verts, faces))
+    return surfaces
+
+
+def write_obj(filename, surfaces):
+    """\
+    Write (name, vertices, faces) surfaces to a Wavefront OBJ file, one
+    group per surface.
+    """
+    with open(filename, 'w') as f:
+        offset = 1
+        for name, verts, faces in surfaces:
+            f.write('g ' + name + '\n')
+            f.write(('v %.6f %.6f %.6f\n' * len(verts)) %
+                    tuple(asarray(verts).ravel().tolist()))
+            f.write(('f %d %d %d\n' * len(faces)) %
+                    tuple((asarray(faces) + offset).ravel().tolist()))
+            offset += len(verts)
+
+
+def write_ply(filename, surfaces):
+    """\
+    Write (name, vertices, faces) surfaces to one binary little-endian
+    PLY mesh, colored by LOBE_COLORS.
+    """
+    vertex = [('x', '<f4'), ('y', '<f4'), ('z', '<f4'),
+              ('red', 'u1'), ('green', 'u1'), ('blue', 'u1')]
+    nverts = sum(len(verts) for name, verts, faces in surfaces)
+    nfaces = sum(len(faces) for name, verts, faces in surfaces)
+    vertices = zeros(nverts, dtype=vertex)
+    triangles = zeros(nfaces, dtype=[('n', 'u1'), ('v', '<i4', (3,))])
+    triangles['n'] = 3
+    start = tri = 0
+    for name, verts, faces in surfaces:
+        end = start + len(verts)
+        for i, axis in enumerate('xyz'):
+            vertices[axis][start:end] = asarray(verts)[:,i]
+        for c, value in zip(('red', 'green', 'blue'),
+                            LOBE_COLORS.get(name, (255, 255, 255))):
+            vertices[c][start:end] = value
+        triangles['v'][tri:tri+len(faces)] = asarray(faces) + start
+        start = end
+        tri += len(faces)
+
+    header = ['ply', 'format binary_little_endian 1.0',
+              'comment isosurface lobes',
+              'element vertex {0}'.format(nverts),
+              'property float x', 'property float y', 'property float z',
+              'property uchar red', 'property uchar green',
+              'property uchar blue',
+              'element face {0}'.format(nfaces),
+              'property list uchar int vertex_indices',
+              'end_header']
+    with open(filename, 'wb') as f:
+        f.write(('\n'.join(header) + '\n').encode('ascii'))
+        f.write(vertices.tobytes())
+        f.write(triangles.tobytes())
+
+
+def write_mesh(filename, surfaces, fmt):
+    """\
+    Write the surfaces in one of MESH_FORMATS.
+    """
+    if fmt == 'obj':
+        write_obj(filename, surfaces)
+    elif fmt == 'ply':
+        write_ply(filename, surfaces)
+    else:
+        raise ValueError('Unknown mesh format: ' + str(fmt))
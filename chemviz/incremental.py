@@ -0,0 +1,261 @@
+"""\
+Incremental rebuilds.  A build manifest, a JSON file, records for every
+input of a command the SHA-1 of the content of its files, the options
+that shape its outputs (radius, grid resolution, scale, frequency
+range, ...) and the outputs written.  A run with the manifest only
+processes the inputs that are new, changed or built with other options,
+or whose outputs went missing, and can keep watching the inputs to
+rebuild the ones that change or appear.
+
+An input whose size and modification time are those recorded is taken
+to be unchanged without reading it again.  Only one run should use a
+manifest at a time.
+"""
+
+from __future__ import print_function, division
+import json, os, sys, time
+from .parsecache import file_hash
+from .batch import report_failures
+
+_VERSION = 1
+
+
+def add_incremental_arguments(parser):
+    """\
+    Add the incremental build options shared by the commands to an
+    ArgumentParser.
+    """
+    parser.add_argument('--incremental', help='Build manifest (a JSON file) '
+                        'of the inputs, options and outputs of earlier runs.  '
+                        'Only inputs that are new or changed, or whose '
+                        'options changed or outputs are missing, are '
+                        'processed, and the manifest is updated.',
+                        required=False)
+    parser.add_argument('--watch', help='With --incremental, keep polling '
+                        'the inputs every WATCH seconds, expanding '
+                        'directories and glob patterns again, and rebuild '
+                        'the outputs of files that change or appear, until '
+                        'interrupted.', type=float, required=False)
+
+
+def check_incremental_arguments(parser, options):
+    """\
+    Check the options of add_incremental_arguments.
+    """
+    if options.watch is not None:
+        if not options.incremental:
+            parser.error('--watch can only be used with --incremental.')
+        if options.watch <= 0:
+            parser.error('The interval of --watch must be positive.')
+
+
+def parameters(options, names):
+    """\
+    The options called `names` as a dict, in the form they take in the
+    JSON manifest (tuples become lists), so they compare equal to the
+    recorded ones.
+    """
+    return json.loads(json.dumps(dict((name, getattr(options, name))
+                                      for name in names)))
+
+
+def _signature(path):
+    """\
+    Size and modification time of a file.
+    """
+    stat = os.stat(path)
+    return [stat.st_size, getattr(stat, 'st_mtime_ns', stat.st_mtime)]
+
+
+class BuildManifest(object):
+    """\
+    The records of the inputs built by `command`, kept in `filename`.
+    An input is a name (the input file, or the output for a command
+    combining several files) with the list of files it is built from.
+    """
+
+    def __init__(self, filename, command):
+        self.filename = filename
+        self.command = command
+        self.builds = {}
+        if os.path.exists(filename):
+            with open(filename) as fl:
+                manifest = json.load(fl)
+            if manifest.get('version') != _VERSION:
+                raise ValueError('Unknown version of the build manifest ' +
+                                 filename)
+            self.builds = manifest['builds']
+
+    def key(self, name):
+        """\
+        Key of the record of the input `name`.
+        """
+        return self.command + ':' + os.path.abspath(name)
+
+    def fingerprint(self, name, paths):
+        """\
+        Size, modification time and SHA-1 of each file of an input.  The
+        hash recorded for a file is reused while its size and
+        modification time are unchanged.
+        """
+        recorded = self.builds.get(self.key(name), {}).get('inputs', {})
+        files = {}
+        for path in paths:
+            path = os.path.abspath(path)
+            signature = _signature(path)
+            previous = recorded.get(path)
+            if previous is not None and previous[:2] == signature:
+                files[path] = previous
+            else:
+                files[path] = signature + [file_hash(path)]
+        return files
+
+    def stale(self, name, paths, params):
+        """\
+        Why the input `name` built from `paths` with the options
+        `params` needs to be built, or None if its outputs are up to
+        date.  Returns the reason and the fingerprint of the files.
+        """
+        files = self.fingerprint(name, paths)
+        record = self.builds.get(self.key(name))
+        if record is None:
+            return 'new', files
+        if record['parameters'] != params:
+            return 'options changed', files
+        if (sorted(record['inputs']) != sorted(files) or
+            any(record['inputs'][path][2] != files[path][2]
+                for path in files)):
+            return 'input changed', files
+        if not all(os.path.exists(path) for path in record['outputs']):
+            return 'output missing', files
+        # A file touched but not changed is checked by size and time
+        # again from now on.
+        record['inputs'] = files
+        return None, files
+
+    def record(self, name, files, params, outputs):
+        """\
+        Record that the input `name`, with the fingerprint `files`, was
+        built with the options `params` into `outputs`.
+        """
+        self.builds[self.key(name)] = {
+            'inputs' : files,
+            'parameters' : params,
+            'outputs' : [os.path.abspath(path) for path in outputs],
+            'built' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+
+    def outputs(self):
+        """\
+        The outputs of every input recorded, by any command.
+        """
+        return set(path for record in self.builds.values()
+                   for path in record['outputs'])
+
+    def save(self):
+        """\
+        Write the manifest, replacing the old one at once.
+        """
+        tmp = '{0}.tmp{1}'.format(self.filename, os.getpid())
+        with open(tmp, 'w') as fl:
+            json.dump({ 'version' : _VERSION, 'builds' : self.builds }, fl,
+                      indent=2, sort_keys=True)
+            fl.write('\n')
+        os.rename(tmp, self.filename)
+
+
+def rebuild(build, inputs, process, params, stream=None):
+    """\
+    Build the stale ones among `inputs`, a list of (name, files) pairs,
+    with process(names), which returns a list of (name, outputs, error)
+    tuples like run_batch.  Successful builds are recorded and the
+    manifest saved.  Returns the results of process.
+    """
+    stream = stream or sys.stderr
+    stale = []
+    fingerprints = {}
+    for name, paths in inputs:
+        reason, fingerprints[name] = build.stale(name, paths, params)
+        if reason:
+            stale.append(name)
+            print('{0}: {1}'.format(name, reason), file=stream)
+    print('{0} of {1} inputs to build, {2} up to date.'.format(
+          len(stale), len(inputs), len(inputs) - len(stale)), file=stream)
+
+    done = process(stale) if stale else []
+    for name, outputs, error in done:
+        if not error:
+            build.record(name, fingerprints[name], params, outputs)
+    build.save()
+    report_failures(done, stream, 'inputs')
+    return done
+
+
+def watch(build, find_inputs, process, params, interval, stream=None):
+    """\
+    Poll the inputs given by find_inputs() every `interval` seconds and
+    rebuild the stale ones, until interrupted.  A file is only picked up
+    once its size and modification time held still over one interval,
+    so files still being written are left alone, and an input that
+    failed is only tried again when it changes.
+    """
+    stream = stream or sys.stderr
+    seen = {}
+    failed = {}
+    print('Watching for changes every {0:g} seconds; press Ctrl-C to '
+          'stop.'.format(interval), file=stream)
+    try:
+        while True:
+            time.sleep(interval)
+            ready = []
+            for name, paths in find_inputs():
+                try:
+                    signature = [_signature(path) for path in paths]
+                except OSError:
+                    # Not (or no longer) there.
+                    continue
+                if failed.get(name) == signature:
+                    continue
+                settled = seen.get(name) == signature
+                seen[name] = signature
+                if settled and build.stale(name, paths, params)[0]:
+                    ready.append((name, paths))
+            if ready:
+                signatures = dict((name, seen[name]) for name, paths in ready)
+                for name, outputs, error in rebuild(build, ready, process,
+                                                    params, stream):
+                    if error:
+                        failed[name] = signatures[name]
+                    else:
+                        failed.pop(name, None)
+    except KeyboardInterrupt:
+        print('Stopped watching.', file=stream)
+
+
+def run_incremental(options, command, find_inputs, process, params,
+                    stream=None):
+    """\
+    Run `command` incrementally with the manifest of the options of
+    add_incremental_arguments.  find_inputs() lists the inputs as (name,
+    files) pairs, process(names) builds some of them (see rebuild), and
+    `params` are the options that shape the outputs (see parameters).
+    Returns the number of inputs that failed; while watching, only the
+    first run counts.
+    """
+    build = BuildManifest(options.incremental, command)
+    manifest = os.path.abspath(options.incremental)
+
+    # An input file that is an output recorded in the manifest, or the
+    # manifest itself, was written next to the inputs and is skipped
+    # when a directory is expanded again.  Inputs built from several
+    # files, named after their output, are always kept.
+    def sources():
+        skipped = build.outputs() | set([manifest])
+        return [(name, paths) for name, paths in find_inputs()
+                if not (paths == [name] and
+                        os.path.abspath(name) in skipped)]
+
+    done = rebuild(build, sources(), process, params, stream)
+    if options.watch is not None:
+        watch(build, sources, process, params, options.watch, stream)
+    return sum(1 for name, outputs, error in done if error)
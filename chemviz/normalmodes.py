@@ -0,0 +1,402 @@
+"""\
+Normal mode vectors and the VMD TCL scripts that draw them.  All modes
+are scaled in one array operation, and each script is formatted as a
+single buffer.  Instead of a script per mode, the modes can be written
+as one bundle: a TCL file with a proc per mode behind a byte-offset
+index, or a NumPy .npz archive or HDF5 group indexed by frequency.
+Modes are looked up by frequency through a sorted FrequencyIndex.  For
+animation, the displaced geometries along each mode are written as
+multi-frame XYZ, DCD or NumPy trajectories.
+"""
+
+from __future__ import print_function, division
+from numpy import asarray, column_stack, full, argsort, savez, save, \
+                  searchsorted, sort, diff, flatnonzero, split, arange, \
+                  sin, pi, array, empty
+from string import ascii_lowercase
+from .profiling import phase
+from .choices import DEFAULT_TOLERANCE
+import struct
+
+# One arrow per atom, from the atom along its scaled displacement.
+VECTOR_FMT = ('vmd_draw_vector2 0 { %13.8f %13.8f %13.8f} '
+              '{ %13.8f %13.8f %13.8f} %4.2f\n')
+
+
+def scale_modes(normal_modes, scale):
+    """\
+    The displacement vectors of all modes, with shape (nmodes, natoms,
+    3), scaled by `scale`.
+    """
+    return float(scale) * asarray(normal_modes, dtype=float)
+
+
+def mode_script(coordinates, displacement, scale, color=None):
+    """\
+    The TCL script drawing the displacement of each atom from its
+    coordinates, optionally setting the draw color first.
+    """
+    coordinates = asarray(coordinates, dtype=float)
+    rows = column_stack((coordinates, displacement,
+                         full(len(coordinates), float(scale))))
+    text = (VECTOR_FMT * len(rows)) % tuple(rows.ravel().tolist())
+    if color:
+        text = 'draw color ' + color + '\n' + text
+    return text
+
+
+def write_mode_script(filename, coordinates, displacement, scale,
+                      color=None):
+    """\
+    Write the TCL script of mode_script to `filename` in one write.
+    """
+    with phase('format'):
+        text = mode_script(coordinates, displacement, scale, color)
+    with phase('write'):
+        with open(filename, 'w') as fl:
+            fl.write(text)
+
+
+def degenerate_suffix(k):
+    """\
+    Suffix of the k-th mode of a degenerate group: none for the first,
+    then _b, _c, ...
+    """
+    if k == 0:
+        return ''
+    if k < len(ascii_lowercase):
+        return '_' + ascii_lowercase[k]
+    return '_' + str(k + 1)
+
+
+def _unique_name(base, k, taken):
+    """\
+    Name the k-th mode of the group `base`, or if that name is in
+    `taken` (two groups with the same rounded frequency) the next free
+    suffix, and add it to `taken`.
+    """
+    name = base + degenerate_suffix(k)
+    while name in taken:
+        k += 1
+        name = base + degenerate_suffix(k)
+    taken.add(name)
+    return name
+
+
+class FrequencyIndex(object):
+    """\
+    The frequencies of a set of modes, sorted once so that lookups by
+    value or range are binary searches.  Lookups return mode indices in
+    the order of the modes.
+    """
+
+    def __init__(self, frequencies):
+        self.frequencies = asarray(frequencies, dtype=float)
+        self.order = argsort(self.frequencies, kind='stable')
+        self.sorted = self.frequencies[self.order]
+
+    def between(self, low, high):
+        """Indices of the modes with low <= frequency <= high."""
+        lo = searchsorted(self.sorted, low, side='left')
+        hi = searchsorted(self.sorted, high, side='right')
+        return sort(self.order[lo:hi])
+
+    def find(self, freq, tol=DEFAULT_TOLERANCE):
+        """Indices of the modes within `tol` of `freq`."""
+        return self.between(freq - tol, freq + tol)
+
+    def groups(self, indices=None, tol=DEFAULT_TOLERANCE):
+        """\
+        Cluster the modes (all, or the given indices) into degenerate
+        groups: sorted by frequency, a new group starts wherever the gap
+        to the next frequency exceeds `tol`.  Each group is an array of
+        mode indices in mode order, and the groups are in order of their
+        first mode.
+        """
+        if indices is None:
+            members = self.order
+        else:
+            indices = asarray(indices, dtype=int)
+            members = indices[argsort(self.frequencies[indices],
+                                      kind='stable')]
+        if not len(members):
+            return []
+        breaks = flatnonzero(diff(self.frequencies[members]) > tol) + 1
+        groups = [sort(g) for g in split(members, breaks)]
+        return sorted(groups, key=lambda g: g[0])
+
+    def name_parts(self, indices=None, tol=DEFAULT_TOLERANCE):
+        """\
+        The base name mode<freq>, after the frequency of the first mode
+        of its degenerate group, and the position in the group of each
+        mode, as a list of (mode index, base, position) in group order.
+        """
+        parts = []
+        for group in self.groups(indices, tol):
+            strfreq = '{0:.2f}'.format(round(self.frequencies[group[0]], 2))
+            for k, i in enumerate(group):
+                parts.append((int(i), 'mode' + strfreq, k))
+        return parts
+
+    def names(self, indices=None, tol=DEFAULT_TOLERANCE):
+        """\
+        Name each mode after its degenerate group, as mode<freq>,
+        mode<freq>_b, ...  Groups that round to the same frequency
+        continue the suffixes of the one before.  Returns a dict of mode
+        index to name.
+        """
+        taken = set()
+        return dict((i, _unique_name(base, k, taken))
+                    for i, base, k in self.name_parts(indices, tol))
+
+
+def select_modes(frequencies, requests=None, low=400.0, high=1800.0,
+                 tol=DEFAULT_TOLERANCE):
+    """\
+    Select modes by frequency.  `requests` lists frequencies and (low,
+    high) ranges; each frequency selects the modes within `tol` of it,
+    named after it, and each range the modes in it, named after their
+    degenerate groups.  Without requests every real mode between `low`
+    and `high` is selected.
+
+    Returns the selection as (index, name) pairs, the numbers of modes
+    skipped as imaginary and out of range (only counted without
+    requests), and a (frequency, number of modes found) pair for every
+    requested frequency.
+    """
+    index = FrequencyIndex(frequencies)
+    skipped = { 'range' : 0 , 'negative' : 0 }
+    selected = []
+    lookups = []
+
+    if requests is None:
+        # Skip negative frequencies, and the modes outside of the range.
+        positive = index.between(0.0, float('inf'))
+        skipped['negative'] = len(index.frequencies) - len(positive)
+        inrange = index.between(max(low, 0.0), high)
+        skipped['range'] = len(positive) - len(inrange)
+        names = index.names(inrange, tol)
+        return [(int(i), names[i]) for i in inrange], skipped, lookups
+
+    # Names are unique across the requests as well.
+    seen = set()
+    taken = set()
+    for request in requests:
+        if isinstance(request, tuple):
+            found = index.between(*request)
+            parts = dict((i, (base, k))
+                         for i, base, k in index.name_parts(found, tol))
+        else:
+            found = index.find(request, tol)
+            lookups.append((request, len(found)))
+            strfreq = '{0:.2f}'.format(round(request,2))
+            parts = dict((i, ('mode' + strfreq, k))
+                         for k, i in enumerate(found))
+        for i in found:
+            if i not in seen:
+                seen.add(i)
+                base, k = parts[i]
+                selected.append((int(i), _unique_name(base, k, taken)))
+    return selected, skipped, lookups
+
+
+# Index line of a TCL bundle: proc name, frequency, and the byte offset
+# and length of the proc.  The fields have a fixed width, so the size of
+# the index is known before the offsets are.
+_INDEX_FMT = '# {0:<24s} {1:16.8f} {2:012d} {3:012d}\n'
+_INDEX_HEAD = ('# chemviz normal mode bundle\n'
+               '# index: name frequency offset length\n')
+
+
+def write_tcl_bundle(filename, coordinates, displacements, frequencies,
+                     names, scale, color=None):
+    """\
+    Write the modes to one TCL file with a proc per mode, named by
+    `names`.  Sourcing the file in VMD defines the procs and the list
+    `modes`; calling a proc draws its mode.  The comment block at the
+    top indexes the procs by byte offset, read by tcl_bundle_index.
+    """
+    procs = []
+    for name, displacement in zip(names, displacements):
+        body = mode_script(coordinates, displacement, scale, color)
+        procs.append(('proc ' + name + ' {} {\n' + body + '}\n')
+                     .encode('ascii'))
+    listing = ('set modes {' + ' '.join(names) + '}\n').encode('ascii')
+
+    # The index has the same size whatever the offsets.
+    size = len(_INDEX_HEAD) + len(listing)
+    size += sum(len(_INDEX_FMT.format(name, 0.0, 0, 0)) for name in names)
+    lines = [_INDEX_HEAD]
+    offset = size
+    for name, freq, proc in zip(names, frequencies, procs):
+        lines.append(_INDEX_FMT.format(name, float(freq), offset, len(proc)))
+        offset += len(proc)
+    with open(filename, 'wb') as fl:
+        fl.write(''.join(lines).encode('ascii'))
+        fl.write(listing)
+        fl.write(b''.join(procs))
+
+
+def tcl_bundle_index(filename):
+    """\
+    Read the index of a TCL bundle as a dict of proc name to (frequency,
+    offset, length), without reading the procs.
+    """
+    index = {}
+    with open(filename) as fl:
+        if fl.readline() != _INDEX_HEAD.splitlines(True)[0]:
+            raise ValueError(filename + ' is not a normal mode bundle')
+        fl.readline()
+        for line in fl:
+            if not line.startswith('# '):
+                break
+            name, freq, offset, length = line[2:].split()
+            index[name] = (float(freq), int(offset), int(length))
+    return index
+
+
+def read_tcl_mode(filename, name, index=None):
+    """\
+    Read the proc of one mode from a TCL bundle by seeking to it.
+    """
+    if index is None:
+        index = tcl_bundle_index(filename)
+    freq, offset, length = index[name]
+    with open(filename, 'rb') as fl:
+        fl.seek(offset)
+        return fl.read(length).decode('ascii')
+
+
+def write_npz_bundle(filename, coordinates, displacements, frequencies,
+                     names, scale):
+    """\
+    Write the modes to an uncompressed .npz archive.  `order` sorts the
+    modes by frequency, so a mode can be found with searchsorted on
+    frequencies[order].
+    """
+    frequencies = asarray(frequencies, dtype=float)
+    savez(filename, coordinates=asarray(coordinates, dtype=float),
+          displacements=asarray(displacements, dtype=float),
+          frequencies=frequencies, order=argsort(frequencies, kind='stable'),
+          names=asarray(names, dtype=str), scale=float(scale))
+
+
+def write_hdf5_bundle(filename, group, coordinates, displacements,
+                      frequencies, names, scale):
+    """\
+    Write the modes into the HDF5 group `group` of `filename`, creating
+    or replacing the group.  The displacements are chunked a mode at a
+    time, so one mode is read without touching the others.  Requires
+    h5py.
+    """
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError('The hdf5 format requires the h5py package')
+    displacements = asarray(displacements, dtype=float)
+    frequencies = asarray(frequencies, dtype=float)
+    with h5py.File(filename, 'a') as h5:
+        if group in h5:
+            del h5[group]
+        g = h5.create_group(group)
+        g.attrs['scale'] = float(scale)
+        g.create_dataset('coordinates', data=asarray(coordinates, dtype=float))
+        chunks = (1,) + displacements.shape[1:] if len(displacements) else None
+        g.create_dataset('displacements', data=displacements, chunks=chunks)
+        g.create_dataset('frequencies', data=frequencies)
+        g.create_dataset('order', data=argsort(frequencies, kind='stable'))
+        g.create_dataset('names', data=[n.encode('ascii') for n in names],
+                         dtype=h5py.string_dtype('ascii'))
+
+
+def write_bundle(fmt, filename, coordinates, displacements, frequencies,
+                 names, scale, color=None, group='modes'):
+    """\
+    Write the modes as one bundle in one of BUNDLE_EXTENSIONS.  The color
+    is only used by tcl and the group only by hdf5.
+    """
+    if fmt == 'tcl':
+        write_tcl_bundle(filename, coordinates, displacements, frequencies,
+                         names, scale, color)
+    elif fmt == 'npz':
+        write_npz_bundle(filename, coordinates, displacements, frequencies,
+                         names, scale)
+    elif fmt == 'hdf5':
+        write_hdf5_bundle(filename, group, coordinates, displacements,
+                          frequencies, names, scale)
+    else:
+        raise ValueError('Unknown bundle format: ' + str(fmt))
+
+
+
+def mode_frames(coordinates, modes, nframes, amplitude):
+    """\
+    One period of the sinusoidal motion along each mode, as an array of
+    shape (nmodes, nframes, natoms, 3).  `modes` has shape (nmodes,
+    natoms, 3), and frame k is displaced by amplitude*sin(2*pi*k/nframes)
+    times the mode.
+    """
+    coordinates = asarray(coordinates, dtype=float)
+    modes = asarray(modes, dtype=float)
+    phase = amplitude * sin(2 * pi * arange(nframes) / nframes)
+    return coordinates + phase[None,:,None,None] * modes[:,None]
+
+
+def write_xyz(filename, symbols, frames, comment=''):
+    """\
+    Write the frames, of shape (nframes, natoms, 3), as a multi-frame XYZ
+    file.  Each frame is formatted with a single %-template.
+    """
+    nframes, natoms = frames.shape[:2]
+    rows = empty((natoms, 4), dtype=object)
+    rows[:,0] = list(symbols)
+    fmt = ('{0}\n{1}\n'.format(natoms, comment) +
+           '%-2s %14.8f %14.8f %14.8f\n' * natoms)
+    with open(filename, 'w') as fl:
+        for frame in frames:
+            rows[:,1:] = frame
+            fl.write(fmt % tuple(rows.ravel().tolist()))
+
+
+def write_dcd(filename, frames, timestep=1.0, title='normal mode'):
+    """\
+    Write the frames, of shape (nframes, natoms, 3), as a CHARMM/NAMD
+    style DCD trajectory with 32-bit little-endian records, which VMD
+    loads onto the molecule.
+    """
+    nframes, natoms = frames.shape[:2]
+
+    def record(data):
+        size = struct.pack('<i', len(data))
+        return size + data + size
+
+    # The control block: the number of frames, first step, steps between
+    # frames and total steps, then the timestep and the CHARMM version.
+    control = struct.pack('<4s9if10i', b'CORD', nframes, 0, 1, nframes,
+                          0, 0, 0, 0, 0, timestep, *([0] * 9 + [24]))
+    titles = struct.pack('<i80s', 1, title.encode('ascii')[:80].ljust(80))
+    # Each frame is a record of all x, then all y, then all z.
+    axes = array(frames, dtype='<f4').transpose(0, 2, 1)
+    size = struct.pack('<i', 4 * natoms)
+    with open(filename, 'wb') as fl:
+        fl.write(record(control))
+        fl.write(record(titles))
+        fl.write(record(struct.pack('<i', natoms)))
+        for frame in axes:
+            for values in frame:
+                fl.write(size + values.tobytes() + size)
+
+
+def write_trajectory(fmt, filename, symbols, frames, comment=''):
+    """\
+    Write the frames of one mode in one of TRAJECTORY_EXTENSIONS.  The
+    symbols and the comment are only used by xyz.
+    """
+    if fmt == 'xyz':
+        write_xyz(filename, symbols, frames, comment)
+    elif fmt == 'dcd':
+        write_dcd(filename, frames)
+    elif fmt == 'npy':
+        save(filename, asarray(frames, dtype=float))
+    else:
+        raise ValueError('Unknown trajectory format: ' + str(fmt))
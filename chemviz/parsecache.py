@@ -0,0 +1,290 @@
+"""\
+Cache of parsed output and cube files, so repeated runs over the same
+data skip the text parsing.  Each entry is a directory of .npy files
+(memory-mapped when loaded) plus a small pickle for everything that is
+not an array, keyed by the path, size, modification time and content
+hash of the source file.  The cache is bounded in size, evicting the
+least recently used entries first.  NumPy and the cube reader are only
+imported when a file is parsed or loaded.
+"""
+
+from __future__ import print_function, division
+import hashlib, pickle, shutil
+import os
+
+# Where the cache lives and how large it may grow, unless overridden.
+DEFAULT_CACHE_DIR = os.environ.get('CHEMVIZ_CACHE_DIR',
+                                   os.path.join(os.path.expanduser('~'),
+                                                '.cache', 'chemviz'))
+DEFAULT_MAX_SIZE = float(os.environ.get('CHEMVIZ_CACHE_SIZE', 2.0)) # GiB
+
+_META = 'meta.pkl'
+_CHUNK = 1 << 20
+
+# Files already parsed in this process, when keep_parsed is on.
+_parsed = None
+
+
+def add_cache_arguments(parser):
+    """\
+    Add the cache options shared by the scripts to an ArgumentParser.
+    """
+    parser.add_argument('--no-cache', help='Parse the input files without '
+                        'using or updating the cache of parsed files.',
+                        action='store_true', default=False)
+    parser.add_argument('--cache-dir', help='Directory of the cache of '
+                        'parsed files.', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--cache-size', help='Largest size of the cache of '
+                        'parsed files in GiB.', default=DEFAULT_MAX_SIZE,
+                        type=float)
+
+
+def cache_from_options(options):
+    """\
+    Build the ParseCache selected by the options of add_cache_arguments.
+    """
+    return ParseCache(options.cache_dir, options.cache_size,
+                      not options.no_cache)
+
+
+def keep_parsed(enabled=True):
+    """\
+    Keep every file parsed through a ParseCache in memory for the rest
+    of the process (or stop doing so), so that many jobs run in one
+    process parse each file once.  An entry is reused while the size and
+    modification time of the file are unchanged.
+    """
+    global _parsed
+    _parsed = {} if enabled else None
+
+
+def _remembered(kind, path):
+    """\
+    Key of `path` parsed as `kind` among the files kept in memory, and
+    the value kept for it (None if there is none).  The key is None when
+    files are not kept.
+    """
+    if _parsed is None:
+        return None, None
+    stat = os.stat(path)
+    key = (kind, os.path.realpath(path), stat.st_size,
+           getattr(stat, 'st_mtime_ns', stat.st_mtime))
+    return key, _parsed.get(key)
+
+
+def file_hash(path):
+    """\
+    SHA-1 of the content of a file, read in chunks.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fl:
+        for chunk in iter(lambda: fl.read(_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ParseCache(object):
+    """\
+    A size-bounded cache of parsed files in `directory`.  With `enabled`
+    false every lookup parses the source file directly.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_size=DEFAULT_MAX_SIZE,
+                 enabled=True):
+        self.directory = directory
+        self.max_size = int(max_size * 1024**3)
+        self.enabled = enabled
+
+    def key(self, path, kind):
+        """\
+        Key of the entry of `path` parsed as `kind`.
+        """
+        stat = os.stat(path)
+        mtime = getattr(stat, 'st_mtime_ns', stat.st_mtime)
+        parts = [kind, os.path.realpath(path), str(stat.st_size), str(mtime),
+                 file_hash(path)]
+        return hashlib.sha1('\0'.join(parts).encode('utf-8')).hexdigest()
+
+    def entry(self, path, kind='collect'):
+        """\
+        Directory of the entry of `path` parsed as `kind`, whether it
+        exists or not.  Working it out hashes the file, so a file read by
+        several workers is best looked up once and its entry handed on.
+        """
+        return os.path.join(self.directory, self.key(path, kind))
+
+    def _lookup(self, path, kind, entry=None):
+        """\
+        Return the entry directory of `path` (unless it is given) and
+        whether it exists.  A hit marks the entry as recently used.
+        """
+        if entry is None:
+            entry = self.entry(path, kind)
+        if os.path.exists(os.path.join(entry, _META)):
+            os.utime(entry, None)
+            return entry, True
+        return entry, False
+
+    def _commit(self, tmp, entry):
+        """\
+        Move a finished entry into place and evict old entries.
+        """
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # Another process stored the same entry first.
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict(keep=entry)
+
+    def _scratch(self, entry):
+        """\
+        Fresh directory to build an entry in before it is moved into
+        place, so readers never see a partial entry.
+        """
+        tmp = '{0}.tmp{1}'.format(entry, os.getpid())
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        return tmp
+
+    def collect(self, path, entry=None):
+        """\
+        chem.collect the file at `path`, from the files kept in memory
+        (see keep_parsed) or the cache if possible.  Array attributes of
+        a cached object are memory-mapped read-only.  The `entry` of the
+        file in the cache, from entry(path), saves hashing it again.
+        """
+        memo, obj = _remembered('collect', path)
+        if obj is None:
+            obj = self._collect(path, entry)
+            if memo is not None:
+                _parsed[memo] = obj
+        return obj
+
+    def _collect(self, path, entry=None):
+        """\
+        collect without the files kept in memory.
+        """
+        from chem import collect
+        from numpy import save, load
+        if not self.enabled:
+            return collect(path)
+        entry, hit = self._lookup(path, 'collect', entry)
+        if hit:
+            with open(os.path.join(entry, _META), 'rb') as fl:
+                cls, state, arrays = pickle.load(fl)
+            obj = cls.__new__(cls)
+            obj.__dict__.update(state)
+            for name, keys in arrays.items():
+                if keys is None:
+                    value = load(os.path.join(entry, name + '.npy'),
+                                 mmap_mode='r')
+                else:
+                    value = dict((k, load(os.path.join(entry, name + '.'
+                                                       + str(i) + '.npy'),
+                                          mmap_mode='r'))
+                                 for i, k in enumerate(keys))
+                setattr(obj, name, value)
+            return obj
+
+        obj = collect(path)
+        tmp = self._scratch(entry)
+        state = {}
+        arrays = {}
+        for name, value in vars(obj).items():
+            if _mappable(value):
+                save(os.path.join(tmp, name + '.npy'), value)
+                arrays[name] = None
+            elif (isinstance(value, dict) and value and
+                  all(_mappable(v) for v in value.values())):
+                keys = list(value)
+                for i, k in enumerate(keys):
+                    save(os.path.join(tmp, name + '.' + str(i) + '.npy'),
+                         value[k])
+                arrays[name] = keys
+            else:
+                state[name] = value
+        with open(os.path.join(tmp, _META), 'wb') as fl:
+            pickle.dump((type(obj), state, arrays), fl, protocol=2)
+        self._commit(tmp, entry)
+        return obj
+
+    def cube(self, path, planes):
+        """\
+        Return the header of the cube file at `path` and its data as an
+        array of shape (n1, n2, runlength).  On a hit the data is
+        memory-mapped; on a miss it is parsed slab by slab into the
+        cache and then memory-mapped, so memory use stays bounded.
+        """
+        memo, cube = _remembered('cube', path)
+        if cube is None:
+            cube = self._cube(path, planes)
+            if memo is not None:
+                _parsed[memo] = cube
+        return cube
+
+    def _cube(self, path, planes):
+        """\
+        cube without the files kept in memory.
+        """
+        from numpy import load
+        from numpy.lib.format import open_memmap
+        from .cubefile import CubeHeader, read_header, iter_slabs
+        entry, hit = self._lookup(path, 'cube')
+        if not hit:
+            tmp = self._scratch(entry)
+            with open(path) as fh:
+                header = read_header(fh)
+                n1, n2, n3 = header.shape
+                data = open_memmap(os.path.join(tmp, 'data.npy'), mode='w+',
+                                   dtype=float,
+                                   shape=(n1, n2, header.runlength))
+                start = 0
+                for slab in iter_slabs(fh, header, planes):
+                    data[start:start+len(slab)] = slab
+                    start += len(slab)
+                data.flush()
+                del data
+            with open(os.path.join(tmp, _META), 'wb') as fl:
+                pickle.dump(header.lines, fl, protocol=2)
+            self._commit(tmp, entry)
+        with open(os.path.join(entry, _META), 'rb') as fl:
+            header = CubeHeader(pickle.load(fl))
+        return header, load(os.path.join(entry, 'data.npy'), mmap_mode='r')
+
+    def evict(self, keep=None):
+        """\
+        Remove the least recently used entries until the cache fits in
+        its maximum size.  The entry `keep` (the one just stored) is
+        never removed.
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            if '.tmp' in name or not os.path.isdir(entry):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, f))
+                       for f in os.listdir(entry))
+            total += size
+            if entry != keep:
+                entries.append((os.path.getmtime(entry), size, entry))
+        for mtime, size, entry in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """\
+        Remove every entry of the cache.
+        """
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+
+def _mappable(value):
+    """\
+    Whether a value can be stored as a .npy file and memory-mapped.
+    """
+    from numpy import ndarray
+    return isinstance(value, ndarray) and not value.dtype.hasobject
@@ -0,0 +1,257 @@
+"""\
+Phase timing for the commands.  With --profile, the wall time, CPU time
+and memory growth of each phase of a run (parse, compute, format, write,
+...) and counts such as grid points, voxels, modes and bytes written
+are recorded and written as a JSON report.  Optionally the run is also
+profiled with cProfile, and traced with tracemalloc for the peak traced
+memory of each phase and the top allocation sites.
+
+Library code marks its phases with `phase` and its counts with `count`,
+which do nothing unless a profile is active.  Phases run in worker
+processes are not recorded, except as part of the time of the phase
+that waits for them; the CPU time of the workers is reported in total.
+"""
+
+from __future__ import print_function, division
+from contextlib import contextmanager
+import json, os, sys, time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# The profile of the running command, if any.
+_active = None
+
+
+def _max_rss():
+    """\
+    Peak resident memory of this process so far in bytes, if known.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _rss():
+    """\
+    Current resident memory of this process in bytes, if known (Linux).
+    """
+    try:
+        with open('/proc/self/statm') as fl:
+            pages = int(fl.read().split()[1])
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def _children_cpu():
+    """\
+    CPU time used by the finished child processes, in seconds.
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Profile(object):
+    """\
+    Timings, memory and counts of the phases of one run.  A phase that
+    is entered several times (say, once per slab) accumulates.  Phases
+    should not nest; an outer phase would include the inner ones.
+
+    The memory of a phase is how much it raised the peak resident memory
+    of the process (zero unless it set a new peak) and how much resident
+    memory it left behind, summed over its calls.
+    """
+
+    def __init__(self, command, trace=False):
+        self.command = command
+        self.trace = trace
+        self.phases = {}
+        self.order = []
+        self.counts = {}
+        self.start_wall = time.time()
+        self.start_cpu = time.process_time()
+        self.start_children = _children_cpu()
+
+    @contextmanager
+    def phase(self, name):
+        """Time the body as (part of) the phase `name`."""
+        if name not in self.phases:
+            self.order.append(name)
+            self.phases[name] = { 'calls' : 0, 'wall' : 0.0, 'cpu' : 0.0,
+                                  'peak_rss_increase' : None,
+                                  'rss_delta' : None }
+            if self.trace:
+                self.phases[name]['peak_traced'] = 0
+        record = self.phases[name]
+        if self.trace:
+            import tracemalloc
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        wall = time.time()
+        cpu = time.process_time()
+        peak = _max_rss()
+        rss = _rss()
+        try:
+            yield
+        finally:
+            record['calls'] += 1
+            record['wall'] += time.time() - wall
+            record['cpu'] += time.process_time() - cpu
+            if peak is not None:
+                record['peak_rss_increase'] = ((record['peak_rss_increase']
+                                                or 0) + _max_rss() - peak)
+            if rss is not None:
+                record['rss_delta'] = (record['rss_delta'] or 0) + \
+                                      _rss() - rss
+            if self.trace:
+                import tracemalloc
+                peak = tracemalloc.get_traced_memory()[1]
+                record['peak_traced'] = max(record['peak_traced'], peak)
+
+    def count(self, name, n=1):
+        """Add `n` to the count `name`."""
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def report(self):
+        """The report as a dict, ready for JSON."""
+        children = _children_cpu()
+        if children is not None:
+            children -= self.start_children
+        report = {
+            'command' : self.command,
+            'argv' : sys.argv,
+            'started' : time.strftime('%Y-%m-%dT%H:%M:%S',
+                                      time.localtime(self.start_wall)),
+            'wall' : time.time() - self.start_wall,
+            'cpu' : time.process_time() - self.start_cpu,
+            'children_cpu' : children,
+            'peak_rss' : _max_rss(),
+            'phases' : [dict(name=name, **self.phases[name])
+                        for name in self.order],
+            'counts' : self.counts,
+        }
+        if self.trace:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            report['top_allocations'] = [
+                { 'site' : str(stat.traceback), 'size' : stat.size,
+                  'count' : stat.count }
+                for stat in snapshot.statistics('lineno')[:20]]
+        return report
+
+
+@contextmanager
+def phase(name):
+    """\
+    Time the body as the phase `name` of the active profile, if any.
+    """
+    if _active is None:
+        yield
+    else:
+        with _active.phase(name):
+            yield
+
+
+def count(name, n=1):
+    """\
+    Add `n` to the count `name` of the active profile, if any.
+    """
+    if _active is not None:
+        _active.count(name, n)
+
+
+def count_bytes(filenames):
+    """\
+    Count the sizes of the files written as bytes_written.
+    """
+    if _active is not None:
+        for name in filenames:
+            if os.path.isfile(name):
+                _active.count('bytes_written', os.path.getsize(name))
+
+
+def add_profile_arguments(parser):
+    """\
+    Add the profiling options shared by the commands to an
+    ArgumentParser.
+    """
+    parser.add_argument('--profile', help='Write the wall time, CPU time '
+                        'and memory growth of each phase of the run, and '
+                        'counts of the work done, to this JSON file.',
+                        required=False)
+    parser.add_argument('--profile-python', help='Also profile the run with '
+                        'cProfile and dump the statistics to this file, '
+                        'for pstats or snakeviz.', required=False)
+    parser.add_argument('--trace-memory', help='Also trace allocations with '
+                        'tracemalloc, for the peak traced memory of each '
+                        'phase and the top allocation sites (slow).',
+                        action='store_true', default=False)
+
+
+def check_profile_arguments(parser, options):
+    """\
+    Check the options of add_profile_arguments.
+    """
+    if options.trace_memory and not options.profile:
+        parser.error('--trace-memory needs --profile for its report.')
+
+
+@contextmanager
+def recording(profile):
+    """\
+    Record the phases and counts of the body in `profile`.
+    """
+    global _active
+    previous = _active
+    _active = profile
+    try:
+        yield profile
+    finally:
+        _active = previous
+
+
+@contextmanager
+def profiled(options, command):
+    """\
+    Profile the body as a run of `command` if the options of
+    add_profile_arguments ask for it, and write the report at the end,
+    even if the run fails.
+    """
+    if not (options.profile or options.profile_python):
+        yield None
+        return
+
+    if options.trace_memory:
+        import tracemalloc
+        tracemalloc.start()
+    profiler = None
+    if options.profile_python:
+        import cProfile
+        profiler = cProfile.Profile()
+    profile = Profile(command, options.trace_memory)
+    try:
+        with recording(profile):
+            if profiler is not None:
+                profiler.enable()
+            try:
+                yield profile
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+    finally:
+        if profiler is not None:
+            profiler.dump_stats(options.profile_python)
+        if options.profile:
+            with open(options.profile, 'w') as fl:
+                json.dump(profile.report(), fl, indent=2, sort_keys=True)
+                fl.write('\n')
+        if options.trace_memory:
+            import tracemalloc
+            tracemalloc.stop()
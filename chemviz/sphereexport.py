@@ -0,0 +1,113 @@
+"""\
+Compact exporters for the unit sphere vector fields, as alternatives to
+the VMD TCL script: a NumPy .npz archive, a binary PLY point set and an
+HDF5 group per molecule.  All of them store the arrow origins, the
+contracted vectors and their magnitudes.
+"""
+
+from __future__ import print_function, division
+from numpy import asarray, savez, zeros
+from .tensors import normalize
+from .vmdscript import write_vector_script
+from .profiling import phase
+from .choices import STACKED_FORMATS
+
+
+def write_npz(filename, origins, vectors, norms, labels, frequencies=None):
+    """\
+    Write a stack of fields to an uncompressed .npz archive, which can be
+    memory-mapped member by member.  `vectors` has shape (nfields,
+    npoints, 3) and `norms` (nfields, npoints); `labels` names each
+    field.
+    """
+    arrays = dict(origins=asarray(origins, dtype=float),
+                  vectors=asarray(vectors, dtype=float),
+                  magnitudes=asarray(norms, dtype=float),
+                  normalized=normalize(norms),
+                  labels=asarray(labels, dtype=str))
+    if frequencies is not None:
+        arrays['frequencies'] = asarray(frequencies, dtype=float)
+    savez(filename, **arrays)
+
+
+def write_ply(filename, origins, vectors, norms):
+    """\
+    Write the field as a binary little-endian PLY point set.  Each vertex
+    is an arrow origin carrying its vector (vx, vy, vz) and magnitude,
+    ready for glyph instancing in ParaView, MeshLab or Blender.
+    """
+    origins = asarray(origins, dtype=float)
+    names = ('x', 'y', 'z', 'vx', 'vy', 'vz', 'magnitude')
+    vertices = zeros(len(origins), dtype=[(n, '<f4') for n in names])
+    for i, n in enumerate(names[:3]):
+        vertices[n] = origins[:,i]
+    for i, n in enumerate(names[3:6]):
+        vertices[n] = asarray(vectors)[:,i]
+    vertices['magnitude'] = norms
+
+    header = ['ply', 'format binary_little_endian 1.0',
+              'comment unit sphere vector field',
+              'element vertex {0}'.format(len(vertices))]
+    header.extend('property float ' + n for n in names)
+    header.append('end_header')
+    with open(filename, 'wb') as f:
+        f.write(('\n'.join(header) + '\n').encode('ascii'))
+        f.write(vertices.tobytes())
+
+
+def write_hdf5(filename, group, origins, vectors, norms, labels,
+               frequencies=None):
+    """\
+    Write a stack of fields into the HDF5 group `group` of `filename`,
+    one subgroup per label, creating or replacing the group and leaving
+    the rest of the file alone.  Requires h5py.
+    """
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError('The hdf5 format requires the h5py package')
+    normalized = normalize(norms)
+    with h5py.File(filename, 'a') as h5:
+        if group in h5:
+            del h5[group]
+        g = h5.create_group(group)
+        g.create_dataset('origins', data=asarray(origins, dtype=float))
+        if frequencies is not None:
+            g.attrs['frequencies'] = asarray(frequencies, dtype=float)
+        for i, label in enumerate(labels):
+            sub = g.create_group(label)
+            sub.create_dataset('vectors', data=asarray(vectors[i]))
+            sub.create_dataset('magnitudes', data=asarray(norms[i]))
+            sub.create_dataset('normalized', data=normalized[i])
+
+
+def export_field(fmt, filename, origins, vectors, norms, colormap='bwr',
+                 nbins=21):
+    """\
+    Write a single field in one of the formats with a file per field.
+    The color options are only used by tcl.
+    """
+    if fmt == 'tcl':
+        write_vector_script(filename, origins, vectors, normalize(norms),
+                            colormap, nbins)
+    elif fmt == 'ply':
+        with phase('write'):
+            write_ply(filename, origins, vectors, norms)
+    else:
+        raise ValueError('Format ' + str(fmt) + ' does not hold single fields')
+
+
+def export_stack(fmt, filename, origins, vectors, norms, labels,
+                 group='fields', frequencies=None):
+    """\
+    Write a stack of fields to one file in one of STACKED_FORMATS.
+    `group` is only used by hdf5.
+    """
+    if fmt not in STACKED_FORMATS:
+        raise ValueError('Format ' + str(fmt) + ' does not hold stacks')
+    with phase('write'):
+        if fmt == 'npz':
+            write_npz(filename, origins, vectors, norms, labels, frequencies)
+        else:
+            write_hdf5(filename, group, origins, vectors, norms, labels,
+                       frequencies)
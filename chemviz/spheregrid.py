@@ -0,0 +1,93 @@
+"""\
+Point sets on a sphere used as incident field directions (and arrow
+origins) for the unit sphere representation.  Grids are built once per
+(kind, resolution, radius) and memoized, optionally on disk as well.
+"""
+
+from __future__ import print_function, division
+from numpy import arange, meshgrid, sin, cos, sqrt, column_stack, save, load
+from math import pi as PI
+import os
+
+# Default resolution for each kind of grid.  For the lattice this is
+# the angular step in degrees, for the Fibonacci sphere it is the
+# number of points (the same as the default lattice).
+DEFAULT_RESOLUTION = { 'lattice' : 10.0, 'fibonacci' : 648 }
+
+# Memoized grids, keyed by (kind, resolution, radius).
+_grids = {}
+
+
+def lattice(step):
+    """\
+    Theta/phi lattice with an angular step of `step` degrees.  Theta runs
+    over (0, 360] and phi over (0, 180], theta varying slowest.  The
+    default step of 10 degrees gives the original 36x18 = 648 points.
+    """
+    ntheta = int(round(360.0 / step))
+    nphi = int(round(180.0 / step))
+    theta = (arange(1, ntheta+1) * step) * PI / 180.0
+    phi = (arange(1, nphi+1) * step) * PI / 180.0
+    theta, phi = meshgrid(theta, phi, indexing='ij')
+    return column_stack((sin(theta).ravel() * cos(phi).ravel(),
+                         sin(theta).ravel() * sin(phi).ravel(),
+                         cos(theta).ravel()))
+
+
+def fibonacci(npoints):
+    """\
+    Nearly uniform Fibonacci (golden spiral) sphere of `npoints` points,
+    without the clustering at the poles of the theta/phi lattice.
+    """
+    npoints = int(npoints)
+    index = arange(npoints, dtype=float)
+    z = 1.0 - (2.0 * index + 1.0) / npoints
+    r = sqrt(1.0 - z**2)
+    angle = index * PI * (3.0 - sqrt(5.0))
+    return column_stack((r * cos(angle), r * sin(angle), z))
+
+
+# The grid of each of choices.GRID_NAMES.
+GRID_KINDS = { 'lattice' : lattice, 'fibonacci' : fibonacci }
+
+
+def build_grid(kind='lattice', resolution=None, radius=1.0, cache_dir=None):
+    """\
+    Return the (npoints, 3) grid of the given kind, resolution and
+    radius.  The result is memoized and read-only.  If `cache_dir` is
+    given the grid is also looked up in (and stored to) that directory
+    as a .npy file, so expensive high-resolution grids survive across
+    runs.
+    """
+    if kind not in GRID_KINDS:
+        raise ValueError('Unknown grid kind: ' + str(kind))
+    if resolution is None:
+        resolution = DEFAULT_RESOLUTION[kind]
+    key = (kind, float(resolution), float(radius))
+    if key in _grids:
+        return _grids[key]
+
+    grid = None
+    if cache_dir:
+        cachefile = os.path.join(cache_dir, 'grid-{0}-{1!r}-{2!r}.npy'.format(*key))
+        if os.path.exists(cachefile):
+            grid = load(cachefile)
+    if grid is None:
+        grid = GRID_KINDS[kind](resolution) * float(radius)
+        if cache_dir:
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                # Made by another process in the meantime.
+                if not os.path.isdir(cache_dir):
+                    raise
+            # Written aside and moved into place, so other processes
+            # never load a partial grid.
+            tmp = '{0}.tmp{1}'.format(cachefile, os.getpid())
+            with open(tmp, 'wb') as fl:
+                save(fl, grid)
+            os.rename(tmp, cachefile)
+
+    grid.setflags(write=False)
+    _grids[key] = grid
+    return grid
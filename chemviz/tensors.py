@@ -0,0 +1,61 @@
+"""\
+Contraction of (hyper)polarizability tensors with incident electric
+fields, done for a whole grid of field directions at once.
+"""
+
+from __future__ import print_function, division
+from numpy import asarray, einsum, sqrt, zeros_like
+
+
+def contract(tensor, fields, rank=None):
+    """\
+    Contract a rank-n response tensor with n-1 copies of each field.
+
+    The last `rank` axes of `tensor` are the Cartesian indices; any
+    leading axes are treated as a stack of tensors (frequencies, types)
+    and are carried through.  `fields` holds the field directions with
+    shape (npoints, 3).  For rank 2 this is alpha_ij E_j and for rank 3
+    it is beta_ijk E_j E_k.  Returns an array of shape
+    (..., npoints, 3).
+    """
+    tensor = asarray(tensor, dtype=float)
+    fields = asarray(fields, dtype=float).reshape(-1, 3)
+    if rank is None:
+        rank = tensor.ndim
+    if rank < 2 or tensor.ndim < rank or tensor.shape[-rank:] != (3,)*rank:
+        raise ValueError('Tensor of shape ' + str(tensor.shape) +
+                         ' does not have ' + str(rank) +
+                         ' Cartesian indices')
+
+    # Build the outer product E x E x ... (n-1 times) for every point,
+    # flattened to (npoints, 3**(n-1)), so the contraction becomes a
+    # single matrix product for the whole grid and tensor stack.
+    npoints = fields.shape[0]
+    outer = fields
+    for i in range(rank - 2):
+        outer = (outer[:, :, None] * fields[:, None, :]).reshape(npoints, -1)
+
+    lead = tensor.shape[:-rank]
+    flat = tensor.reshape(lead + (3, 3**(rank-1)))
+    return einsum('...ik,pk->...pi', flat, outer)
+
+
+def magnitudes(vectors):
+    """\
+    Euclidean norm of each vector along the last axis.
+    """
+    vectors = asarray(vectors, dtype=float)
+    return sqrt(einsum('...i,...i->...', vectors, vectors))
+
+
+def normalize(norms):
+    """\
+    Scale the norms of each grid so the largest is 1.  Leading axes are
+    treated independently; an all-zero grid stays zero.
+    """
+    norms = asarray(norms, dtype=float)
+    maximum = norms.max(axis=-1, keepdims=True)
+    scaled = zeros_like(norms)
+    nonzero = (maximum > 0.0)[..., 0]
+    scaled[nonzero] = norms[nonzero] / maximum[nonzero]
+    return scaled
@@ -0,0 +1,66 @@
+"""\
+Unit sphere representations of (hyper)polarizabilities: the response
+tensors of a parsed output file contracted with electric fields along
+the directions of a sphere grid, as arrays.
+"""
+
+from __future__ import print_function, division
+from numpy import asarray, concatenate
+from .tensors import contract, magnitudes
+from .spheregrid import build_grid
+
+
+def response_tensors(data):
+    """\
+    Collect the polarizabilities or hyperpolarizabilities of a parsed
+    output file, for all frequencies and types, as one stack.  Returns
+    the rank of the tensors, a (label, file suffix) pair for each tensor,
+    and the stacked tensors.
+    """
+
+    # The contraction of the tensor with the electric field(s) depends
+    # on whether the calculated property is the polarizability or
+    # hyperpolarizability.
+    if 'POLARIZABILITY' in data.calctype:
+        rank = 2
+        # The first index accounts for the frequency dependence.
+        tensors = [('polarizability', '', data.polarizability)]
+    elif 'HYPERPOLARIZABILITY' in data.calctype:
+        rank = 3
+        # Types of hyperpolarizabilities.
+        htypes = ('SHG', 'EOPE', 'OR', 'STATIC',)
+        tensors = [(item.lower(), item.lower(), data.hyperpolarizability[item])
+                   for item in htypes if item in data.calctype]
+    else:
+        raise ValueError('No polarizability or hyperpolarizability found')
+
+    # Label the frequencies when there is more than one.
+    names = []
+    stack = []
+    for label, suffix, tensor in tensors:
+        tensor = asarray(tensor, dtype=float).reshape((-1,) + (3,)*rank)
+        for i in range(len(tensor)):
+            if len(tensor) > 1:
+                freq = 'freq' + str(i)
+                names.append((label + '_' + freq,
+                              '_'.join(s for s in (suffix, freq) if s)))
+            else:
+                names.append((label, suffix))
+        stack.append(tensor)
+    return rank, names, concatenate(stack)
+
+
+def sphere_fields(data, grid='lattice', resolution=None, radius=1.0,
+                  cache_dir=None):
+    """\
+    Contract every response tensor of a parsed output file (all
+    frequencies of every type) as one stack against a shared grid of
+    field directions.  Returns the (label, file suffix) pair of each
+    tensor, the arrow origins on the sphere of `radius`, the fields
+    with shape (ntensors, npoints, 3) and their magnitudes.
+    """
+    directions = build_grid(grid, resolution, 1.0, cache_dir)
+    origins = build_grid(grid, resolution, float(radius), cache_dir)
+    rank, names, stack = response_tensors(data)
+    fields = contract(stack, directions, rank)
+    return names, origins, fields, magnitudes(fields)
@@ -0,0 +1,119 @@
+"""\
+Writer for the VMD TCL scripts that draw the unit sphere vectors.  The
+normalized magnitudes are binned against a color map table in one pass
+and the whole script is formatted in memory and written at once.
+"""
+
+from __future__ import print_function, division
+from numpy import asarray, column_stack, minimum, clip, linspace, interp
+from .profiling import phase
+from .choices import COLORMAPS, MAX_BINS
+
+# The blue-white-red map used by the original scripts, as (VMD color
+# id, rgb) from the smallest to the largest intensity.  Built-in VMD
+# colors that are used as they are have no rgb.
+BWR_TABLE = (
+    (0, None), # Blue (smallest intensity)
+    (11, (0.1, 0.1, 1.0)),
+    (12, (0.2, 0.2, 1.0)),
+    (13, (0.3, 0.3, 1.0)),
+    (14, (0.4, 0.4, 1.0)),
+    (15, (0.5, 0.5, 1.0)),
+    (17, (0.6, 0.6, 1.0)),
+    (18, (0.7, 0.7, 1.0)),
+    (19, (0.8, 0.8, 1.0)),
+    (20, (0.9, 0.9, 1.0)),
+    (8, None), # White
+    (29, (1.0, 0.9, 0.9)),
+    (28, (1.0, 0.8, 0.8)),
+    (27, (1.0, 0.7, 0.7)),
+    (26, (1.0, 0.6, 0.6)),
+    (25, (1.0, 0.5, 0.5)),
+    (24, (1.0, 0.4, 0.4)),
+    (23, (1.0, 0.3, 0.3)),
+    (22, (1.0, 0.2, 0.2)),
+    (21, (1.0, 0.1, 0.1)),
+    (1, None), # Red (largest intensity)
+)
+
+# VMD color ids 33 to 1056 (choices.MAX_BINS of them) make up the color
+# scale, and are free to be redefined for interpolated tables.
+FIRST_SCALE_ID = 33
+
+VECTOR_FMT = ('draw color %d\n'
+              'vmd_draw_vector 0 {%8.5F %8.5F %8.5F} '
+              '{%12.5E %12.5E %12.5E} 0.1 30 0.08\n')
+
+
+def register_colormap(name, anchors):
+    """\
+    Make a new color map available under `name`.  `anchors` is a
+    sequence of at least two rgb triples from the smallest to the
+    largest intensity.
+    """
+    anchors = tuple(tuple(float(c) for c in rgb) for rgb in anchors)
+    if len(anchors) < 2 or any(len(rgb) != 3 for rgb in anchors):
+        raise ValueError('A color map needs at least two rgb anchors')
+    COLORMAPS[name] = anchors
+
+
+def colormap_table(colormap='bwr', nbins=21):
+    """\
+    Return the (VMD color id, rgb) table with `nbins` entries for the
+    named color map.  The default reproduces the original 21 colors.
+    """
+    if colormap not in COLORMAPS:
+        raise ValueError('Unknown color map: ' + str(colormap))
+    nbins = int(nbins)
+    if nbins < 1 or nbins > MAX_BINS:
+        raise ValueError('The number of color bins must be between 1 and '
+                         + str(MAX_BINS))
+    if colormap == 'bwr' and nbins == len(BWR_TABLE):
+        return BWR_TABLE
+
+    anchors = asarray(COLORMAPS[colormap])
+    where = linspace(0.0, 1.0, len(anchors))
+    at = linspace(0.0, 1.0, nbins) if nbins > 1 else asarray([0.5])
+    rgb = column_stack([interp(at, where, anchors[:,i]) for i in range(3)])
+    return tuple((FIRST_SCALE_ID + i, tuple(rgb[i])) for i in range(nbins))
+
+
+def color_bins(values, nbins):
+    """\
+    Bin normalized values in [0, 1] into `nbins` equal bins; 1 falls in
+    the last bin.
+    """
+    values = clip(asarray(values, dtype=float), 0.0, 1.0)
+    return minimum((values * nbins).astype(int), nbins - 1)
+
+
+def vector_script(origins, vectors, values, colormap='bwr', nbins=21):
+    """\
+    Build the TCL script drawing each vector at its origin, colored by
+    its normalized magnitude in `values`, and return it as one string.
+    """
+    table = colormap_table(colormap, nbins)
+    ids = asarray([cid for cid, rgb in table])[color_bins(values, len(table))]
+
+    # Redefine the colors of the table, in order of the color id.
+    lines = ['color change rgb {0} {1}\n'.format(
+                 cid, ' '.join(str(round(c, 4)) for c in rgb))
+             for cid, rgb in sorted(table) if rgb is not None]
+
+    # Format every vector with one call on a flat tuple of the values.
+    rows = column_stack((ids, asarray(origins, dtype=float),
+                         asarray(vectors, dtype=float)))
+    lines.append((VECTOR_FMT * len(rows)) % tuple(rows.ravel().tolist()))
+    return ''.join(lines)
+
+
+def write_vector_script(filename, origins, vectors, values, colormap='bwr',
+                        nbins=21):
+    """\
+    Write the TCL script of vector_script to `filename` in one write.
+    """
+    with phase('format'):
+        text = vector_script(origins, vectors, values, colormap, nbins)
+    with phase('write'):
+        with open(filename, 'w') as f:
+            f.write(text)